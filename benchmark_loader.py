@@ -0,0 +1,185 @@
+import os
+import re
+import glob
+import json
+import time
+import yaml
+import torch
+import platform
+import argparse
+import importlib
+import itertools
+import subprocess
+import numpy as np
+from dataset.stores import resolve_descriptor
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def memory_mb(pid):
+    # resident and proportional set size of a process; PSS splits the shared pages (mapped stores) between
+    # the processes mapping them, so the PSS of the workers adds up to what they really use. Linux only
+    usage = {'RSS': 0, 'Pss': 0}
+    for path in [f"/proc/{pid}/smaps_rollup", f"/proc/{pid}/status"]:
+        try:
+            with open(path, "r") as f:
+                for line in f:
+                    key = line.split(":")[0].replace("VmRSS", "RSS").replace("Rss", "RSS")
+                    if key in usage and usage[key] == 0:
+                        usage[key] = int(line.split()[1]) / 1024
+        except OSError:
+            pass
+    return usage
+
+
+def store_files(dataset_info, datatype, mode):
+    # files of a store: every template of its config entry (path, index, local_path) with the per-sample and
+    # per-shard fields as wildcards, plus its siblings (index, chunk table, tar shards) and directory contents
+    descriptor = resolve_descriptor(dataset_info.get('stores', dict()).get(datatype, dict()), mode)
+    files = set()
+    for template in [descriptor.get(key) for key in ['path', 'index', 'local_path']]:
+        if not isinstance(template, str):
+            continue
+        pattern = template.replace("{prefix}", dataset_info['dataset_root']).replace("{mode}", mode)
+        pattern = re.sub(r"\{[^}]*\}", "*", pattern)
+        for path in glob.glob(f"{os.path.splitext(pattern)[0]}*"):
+            if os.path.isdir(path):
+                files.update(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+            else:
+                files.add(path)
+    return sorted(files)
+
+
+def drop_page_cache(paths):
+    # evicts the cached pages of the files, so that the next configuration reads from storage like a first
+    # epoch; pages still mapped by a live process are kept. Returns the bytes of the files
+    if not hasattr(os, "posix_fadvise"):
+        raise OSError("--drop-caches needs posix_fadvise (Linux)")
+    total = 0
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            total += os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+    return total
+
+
+def build_feeder(args, dataset_info, gloss_dict, datatype, transform):
+    # imported like main.import_class, without importing main and the models
+    module, name = args.feeder.rsplit('.', 1)
+    feeder = getattr(importlib.import_module(module), name)
+    return feeder(prefix=dataset_info['dataset_root'], gloss_dict=gloss_dict, dataset=args.dataset, mode=args.mode,
+                  transform_mode=transform == "train", datatype=datatype, kernel_size=args.kernel_size,
+                  stores=dataset_info.get('stores', dict()))
+
+
+def benchmark_loader(feeder, num_worker, batch_size, pin_memory, batches, warmup, seed=0):
+    generator = torch.Generator()
+    generator.manual_seed(seed)
+    # streaming feeders shuffle themselves
+    shuffle = not isinstance(feeder, torch.utils.data.IterableDataset)
+    loader = torch.utils.data.DataLoader(feeder, batch_size=batch_size, shuffle=shuffle, drop_last=True,
+                                         num_workers=num_worker, pin_memory=pin_memory,
+                                         generator=generator if shuffle else None,
+                                         collate_fn=feeder.collate_fn)
+    batches = min(batches, len(loader) - warmup)
+    if batches <= 0:
+        raise ValueError(f"{len(loader)} batches of {batch_size} samples, fewer than the {warmup} warmup batches")
+    # the workers read ahead of the batches handed out (prefetch_factor per worker), so no snapshot taken
+    # between batches matches them: the meter covers every sample read until the workers are shut down
+    since = feeder.read_meter.snapshot()
+    iterator = iter(loader)
+    # worker start-up and the first reads are not timed
+    for _ in range(warmup):
+        next(iterator)
+    latencies, samples, frames = [], 0, 0
+    start_time = last = time.time()
+    for _ in range(batches):
+        data = next(iterator)
+        now = time.time()
+        latencies.append(now - last)
+        last = now
+        samples += len(data[1])
+        frames += int(data[4].sum())
+    elapsed = time.time() - start_time
+    workers = [memory_mb(worker.pid) for worker in getattr(iterator, '_workers', [])]
+    main_memory = memory_mb(os.getpid())
+    # shuts the workers down, so that the samples they read ahead are counted as well
+    del iterator
+    read = feeder.read_meter.report(since)
+    read_per_sample = read['MB read'] / max(read['samples'], 1)
+    return {
+        'batches': batches,
+        'seconds': elapsed,
+        'samples/s': samples / elapsed,
+        'frames/s': frames / elapsed,
+        'p50 batch ms': float(np.percentile(latencies, 50)) * 1000,
+        'p99 batch ms': float(np.percentile(latencies, 99)) * 1000,
+        'MB read': read_per_sample * samples,
+        'MB read/sample': read_per_sample,
+        'samples read': read['samples'],
+        'read ms/sample': read['read ms/sample'],
+        'main RSS MB': main_memory['RSS'],
+        'worker RSS MB': sum(worker['RSS'] for worker in workers),
+        'worker PSS MB': sum(worker['Pss'] for worker in workers),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Throughput of the feeder and collate_fn through a DataLoader, without the model.')
+    parser.add_argument('--dataset', type=str, default='phoenix2014', help='dataset, stores come from its config')
+    parser.add_argument('--mode', type=str, default='dev', help='split to read')
+    parser.add_argument('--feeder', type=str, default='dataset.dataloader_video.BaseFeeder', help='feeder class')
+    parser.add_argument('--kernel-size', type=str, nargs='+', default=['K5', 'P2', 'K5', 'P2'],
+                        help='temporal kernels of the model, decide the padding of collate_fn')
+    parser.add_argument('--datatypes', type=str, nargs='+', default=['memmap', 'numpy', 'video'],
+                        help='datatypes to compare, any registered store or features')
+    parser.add_argument('--num-workers', type=int, nargs='+', default=[0, 4, 8], help='dataloader workers')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[2], help='batch sizes')
+    parser.add_argument('--pin-memory', type=int, nargs='+', default=[1], choices=[0, 1],
+                        help='pin_memory settings')
+    parser.add_argument('--transforms', type=str, nargs='+', default=['train', 'test'], choices=['train', 'test'],
+                        help='augmentation of the feeder')
+    parser.add_argument('--batches', type=int, default=50, help='timed batches per configuration')
+    parser.add_argument('--warmup', type=int, default=5, help='batches read before timing')
+    parser.add_argument('--drop-caches', action='store_true', default=False,
+                        help='evict the store files from the page cache before every configuration, otherwise later '
+                             'configurations read what earlier ones cached')
+    parser.add_argument('--output', type=str, default=None,
+                        help='json results, defaults to ./benchmark/loader-{dataset}-{commit}.json')
+    args = parser.parse_args()
+
+    with open(f"./configs/{args.dataset}.yaml", 'r') as f:
+        dataset_info = yaml.load(f, Loader=yaml.FullLoader)
+    gloss_dict = np.load(dataset_info['dict_path'], allow_pickle=True).item()
+    commit = git_commit()
+    results = []
+    for datatype, transform, num_worker, batch_size, pin_memory in itertools.product(
+            args.datatypes, args.transforms, args.num_workers, args.batch_sizes, args.pin_memory):
+        config = dict(datatype=datatype, transform=transform, num_worker=num_worker, batch_size=batch_size,
+                      pin_memory=bool(pin_memory), page_cache="dropped" if args.drop_caches else "warm")
+        if args.drop_caches:
+            # before the feeder is built, its mappings would keep their pages cached
+            config['MB dropped'] = drop_page_cache(store_files(dataset_info, datatype, args.mode)) / 1024 ** 2
+        feeder = build_feeder(args, dataset_info, gloss_dict, datatype, transform)
+        config.update(benchmark_loader(feeder, num_worker, batch_size, bool(pin_memory), args.batches,
+                                       args.warmup))
+        del feeder
+        results.append(config)
+        print(", ".join(f"{k}: {v:.2f}" if isinstance(v, float) else f"{k}: {v}" for k, v in config.items()))
+    output = args.output or f"./benchmark/loader-{args.dataset}-{commit}.json"
+    if os.path.dirname(output) != "" and not os.path.exists(os.path.dirname(output)):
+        os.makedirs(os.path.dirname(output))
+    with open(output, "w") as f:
+        json.dump(dict(vars(args), commit=commit, host=platform.node(), cpus=os.cpu_count(),
+                       torch=torch.__version__, results=results), f, indent=2)
+    print(f"Results written to {output}")
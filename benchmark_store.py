@@ -0,0 +1,85 @@
+import json
+import time
+import yaml
+import argparse
+import numpy as np
+
+from utils import video_augmentation
+from dataset.stores import build_store
+from dataset.metadata import load_metadata
+from dataset import compressed_store, lmdb_store, mp4_store  # register the "compressed", "lmdb" and "mp4" datatypes
+
+
+def disk_read_bytes():
+    # bytes this process actually fetched from the block layer (page cache misses), Linux only
+    try:
+        with open("/proc/self/io", "r") as f:
+            for line in f:
+                if line.startswith("read_bytes"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def build_transform(transform_mode, input_size=224):
+    if transform_mode == "train":
+        return video_augmentation.Compose([
+            video_augmentation.RandomCrop(input_size),
+            video_augmentation.RandomHorizontalFlip(0.5),
+            video_augmentation.TemporalRescale(0.2),
+        ])
+    return video_augmentation.Compose([
+        video_augmentation.CenterCrop(input_size),
+    ])
+
+
+def benchmark_store(store, infos, samples, transform, seed=0):
+    store.bind([fi['fileid'] for fi in infos], [fi['folder'] for fi in infos])
+    order = np.random.RandomState(seed).permutation(len(infos))[:samples]
+    frames = 0
+    bytes_read = store.bytes_read
+    disk_bytes = disk_read_bytes()
+    start_time = time.time()
+    for idx in order:
+        fi = infos[idx]
+        read_args, _ = transform.plan(store.num_frames(idx, fi), store.frame_shape)
+        frames += len(store.read(idx, fi, **read_args))
+    elapsed = time.time() - start_time
+    return {
+        'samples': len(order),
+        'seconds': elapsed,
+        'samples/s': len(order) / elapsed,
+        'frames/s': frames / elapsed,
+        'MB read': (store.bytes_read - bytes_read) / 1024 ** 2,
+        'MB read/sample': (store.bytes_read - bytes_read) / 1024 ** 2 / len(order),
+        'MB from disk': (disk_read_bytes() - disk_bytes) / 1024 ** 2,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare read throughput of the frame stores of a dataset.')
+    parser.add_argument('--dataset', type=str, default='phoenix2014', help='dataset, stores come from its config')
+    parser.add_argument('--mode', type=str, default='dev', help='split to read')
+    parser.add_argument('--datatypes', type=str, nargs='+', default=['memmap', 'numpy', 'lmdb', 'compressed'],
+                        help='stores to compare')
+    parser.add_argument('--samples', type=int, default=200, help='random samples read per store')
+    parser.add_argument('--transform', type=str, default='train', choices=['train', 'test'],
+                        help='crop/temporal sampling planned before each read')
+    parser.add_argument('--output', type=str, default=None, help='write the results as json')
+    args = parser.parse_args()
+
+    with open(f"./configs/{args.dataset}.yaml", 'r') as f:
+        dataset_info = yaml.load(f, Loader=yaml.FullLoader)
+    gloss_dict = np.load(dataset_info['dict_path'], allow_pickle=True).item()
+    inputs_list = load_metadata(f"./preprocess/{args.dataset}", args.mode, gloss_dict)
+    infos = [inputs_list[i] for i in range(len(inputs_list))]
+    results = dict()
+    for datatype in args.datatypes:
+        store = build_store(datatype, args.dataset, args.mode, dataset_info['dataset_root'],
+                            dataset_info.get('stores', dict()))
+        results[datatype] = benchmark_store(store, infos, args.samples, build_transform(args.transform))
+        print(datatype, ", ".join(f"{k}: {v:.2f}" for k, v in results[datatype].items()))
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(dict(vars(args), results=results), f, indent=2)
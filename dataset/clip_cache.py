@@ -0,0 +1,81 @@
+import mmap
+import numpy as np
+import multiprocessing as mp
+
+
+class SharedClipCache(object):
+    """
+    Decoded clips (before augmentation) shared by all dataloader workers of a feeder, within a byte budget.
+    The cache is a pool of one-frame pages in an anonymous shared mapping plus shared page and sample
+    tables, all created before the workers fork; least recently used clips are evicted to make room.
+    Relies on the fork start method, the default on Linux.
+    """
+
+    def __init__(self, budget_bytes, num_samples, frame_shape):
+        self.frame_shape = tuple(frame_shape)
+        self.page_bytes = int(np.prod(self.frame_shape))
+        self.num_pages = max(int(budget_bytes) // self.page_bytes, 1)
+        self.buffer = mmap.mmap(-1, self.num_pages * self.page_bytes)
+        self.pages = np.frombuffer(self.buffer, dtype=np.uint8).reshape(self.num_pages, *self.frame_shape)
+        # sample owning every page (-1 if free) and the position of the page in that clip
+        self.page_owner = self.shared_array(self.num_pages, -1)
+        self.page_frame = self.shared_array(self.num_pages, 0)
+        # frames cached per sample (0 if not cached) and its last use
+        self.cached_frames = self.shared_array(num_samples, 0)
+        self.last_used = self.shared_array(num_samples, 0)
+        # clock, hits, misses, evictions
+        self.counters = self.shared_array(4, 0)
+        self.lock = mp.Lock()
+
+    @staticmethod
+    def shared_array(size, value):
+        array = np.frombuffer(mp.RawArray('q', int(size)), dtype=np.int64)
+        array[:] = value
+        return array
+
+    def touch(self, index):
+        self.counters[0] += 1
+        self.last_used[index] = self.counters[0]
+
+    def get(self, index):
+        with self.lock:
+            if self.cached_frames[index] == 0:
+                self.counters[2] += 1
+                return None
+            self.counters[1] += 1
+            self.touch(index)
+            pages = np.flatnonzero(self.page_owner == index)
+            # copied while locked, the pages may be given to another clip right after
+            return self.pages[pages[np.argsort(self.page_frame[pages])]]
+
+    def put(self, index, clip):
+        if clip.shape[1:] != self.frame_shape or len(clip) > self.num_pages or len(clip) == 0:
+            return
+        with self.lock:
+            if self.cached_frames[index] > 0:
+                return
+            free = np.flatnonzero(self.page_owner < 0)
+            while len(free) < len(clip):
+                cached = np.flatnonzero(self.cached_frames > 0)
+                victim = cached[np.argmin(self.last_used[cached])]
+                self.page_owner[self.page_owner == victim] = -1
+                self.cached_frames[victim] = 0
+                self.counters[3] += 1
+                free = np.flatnonzero(self.page_owner < 0)
+            pages = free[:len(clip)]
+            self.pages[pages] = clip
+            self.page_owner[pages] = index
+            self.page_frame[pages] = np.arange(len(clip))
+            self.cached_frames[index] = len(clip)
+            self.touch(index)
+
+    def stats(self):
+        hits, misses, evictions = (int(c) for c in self.counters[1:])
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit rate': hits / max(hits + misses, 1),
+            'evictions': evictions,
+            'cached clips': int((self.cached_frames > 0).sum()),
+            'used MB': float((self.page_owner >= 0).sum()) * self.page_bytes / 1024 ** 2,
+        }
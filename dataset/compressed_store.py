@@ -0,0 +1,154 @@
+import os
+import json
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from dataset.stores import FrameStore, register_store, load_index, resolve_index, save_index, fadvise_willneed, \
+    window_shape
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+CHUNK_DTYPE = [('offset', np.int64), ('frame', np.int64)]
+
+
+def check_codec(codec):
+    if codec == "zstd" and zstandard is None:
+        raise ImportError("The zstd codec of the compressed store needs the `zstandard` package: "
+                          "`pip install zstandard`, or `pip install -r requirements-optional.txt`")
+    if codec == "lz4" and lz4 is None:
+        raise ImportError("The lz4 codec of the compressed store needs the `lz4` package: "
+                          "`pip install lz4`, or `pip install -r requirements-optional.txt`")
+    if codec not in ["zstd", "lz4"]:
+        raise ValueError(f"Unknown codec: {codec}, expected zstd or lz4")
+
+
+def compress_clip(frames, codec="zstd", level=3, chunk_frames=8):
+    """
+    Losslessly compress a (T, H, W, C) clip into chunks of chunk_frames frames. Chunks never span clips,
+    so a sample is read without touching its neighbours. Safe to call from a process pool.
+    """
+    check_codec(codec)
+    frames = np.ascontiguousarray(frames)
+    if codec == "zstd":
+        compressor = zstandard.ZstdCompressor(level=level)
+        compress = compressor.compress
+    else:
+        compress = lambda buf: lz4.frame.compress(buf, compression_level=level)
+    return [compress(frames[i:i + chunk_frames].tobytes()) for i in range(0, len(frames), chunk_frames)]
+
+
+class CompressedWriter(object):
+    """
+    Appends compressed clips to `path` and writes, on close, the offset index (`path`.index.npy),
+    the chunk table (`path`.chunks.npy) and the store settings (`path`.json).
+    """
+
+    def __init__(self, path, frame_shape=(256, 256, 3), codec="zstd", level=3, chunk_frames=8):
+        check_codec(codec)
+        self.path = path
+        self.meta = dict(codec=codec, level=level, chunk_frames=chunk_frames, frame_shape=list(frame_shape),
+                         dtype="uint8")
+        self.file = open(path, "wb")
+        self.fileids, self.starts, self.ends = [], [], []
+        self.chunks = []
+        self.num_frames = 0
+
+    def add(self, fileid, num_frames, chunks):
+        # chunks as returned by compress_clip
+        self.fileids.append(fileid)
+        self.starts.append(self.num_frames)
+        for i, chunk in enumerate(chunks):
+            self.chunks.append((self.file.tell(), self.num_frames + i * self.meta['chunk_frames']))
+            self.file.write(chunk)
+        self.num_frames += num_frames
+        self.ends.append(self.num_frames)
+
+    def close(self):
+        self.chunks.append((self.file.tell(), self.num_frames))
+        self.file.close()
+        save_index(f"{self.path}.index.npy", self.fileids, self.starts, self.ends)
+        np.save(f"{self.path}.chunks.npy", np.array(self.chunks, dtype=CHUNK_DTYPE))
+        with open(f"{self.path}.json", "w") as f:
+            json.dump(self.meta, f)
+
+
+@register_store("compressed")
+class CompressedStore(FrameStore):
+    """
+    Frames stored as zstd/lz4 compressed chunks with a random-access chunk table. Only the chunks holding
+    the sampled frames are read, and they are decompressed by a thread pool inside the worker.
+    """
+
+    def __init__(self, path, index=None, threads=4, **kwargs):
+        super(CompressedStore, self).__init__(**kwargs)
+        self.path = self.format(path)
+        self.index_path = self.format(index) if index is not None else f"{self.path}.index.npy"
+        with open(f"{self.path}.json", "r") as f:
+            self.meta = json.load(f)
+        check_codec(self.meta['codec'])
+        self.frame_shape = tuple(self.meta['frame_shape'])
+        self.threads = threads
+        self.spans = None
+        self.fd = None
+        self.pool = None
+        self.prefetch_fd = None
+
+    def bind(self, fileids, folders):
+        self.spans = resolve_index(load_index(self.index_path), fileids)
+        self.chunks = np.load(f"{self.path}.chunks.npy", mmap_mode="r")
+
+    def open(self):
+        # opened lazily so that every dataloader worker has its own descriptor and threads
+        self.fd = os.open(self.path, os.O_RDONLY)
+        self.pool = ThreadPoolExecutor(self.threads)
+        self.local = threading.local()
+
+    def decompress(self, buf):
+        if self.meta['codec'] == "lz4":
+            return lz4.frame.decompress(buf)
+        # zstd decompressors must not be shared between threads
+        if not hasattr(self.local, 'decompressor'):
+            self.local.decompressor = zstandard.ZstdDecompressor()
+        return self.local.decompressor.decompress(buf)
+
+    def read_chunk(self, chunk_id):
+        offset, next_offset = self.chunks['offset'][chunk_id], self.chunks['offset'][chunk_id + 1]
+        buf = os.pread(self.fd, int(next_offset - offset), int(offset))
+        frames = np.frombuffer(self.decompress(buf), dtype=np.uint8)
+        return frames.reshape(-1, *self.frame_shape)
+
+    def num_frames(self, index, fi):
+        return int(self.spans[index][1] - self.spans[index][0])
+
+    def prefetch(self, index):
+        if self.prefetch_fd is None:
+            # a descriptor of its own, the reading one is opened per worker
+            self.prefetch_fd = os.open(self.path, os.O_RDONLY)
+        start, end = self.spans[index]
+        first, last = np.searchsorted(self.chunks['frame'], [start, end], side="left")
+        offset = int(self.chunks['offset'][first])
+        fadvise_willneed(self.prefetch_fd, offset, int(self.chunks['offset'][last]) - offset)
+
+    def read(self, index, fi, crop=None, flip=False, frame_index=slice(None)):
+        if self.fd is None:
+            self.open()
+        start, end = self.spans[index]
+        frames = np.arange(start, end)[frame_index]
+        chunk_of_frame = np.searchsorted(self.chunks['frame'], frames, side="right") - 1
+        chunk_ids = np.unique(chunk_of_frame)
+        rows, cols = self.window(crop, flip)
+        chunk_frames = self.pool.map(self.read_chunk, chunk_ids)
+        self.bytes_read += int(np.sum(self.chunks['offset'][chunk_ids + 1] - self.chunks['offset'][chunk_ids]))
+        # allocated from the window shape, so that a read of no frames is an empty clip like MemmapStore's
+        clip = np.empty((len(frames), *window_shape(self.frame_shape, rows, cols)), dtype=np.uint8)
+        for chunk_id, decoded in zip(chunk_ids, chunk_frames):
+            pos = np.flatnonzero(chunk_of_frame == chunk_id)
+            clip[pos] = decoded[frames[pos] - self.chunks['frame'][chunk_id], rows, cols]
+        return clip
@@ -0,0 +1,69 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+
+class CropCache(object):
+    """
+    Cropped uint8 clips of a split with a deterministic transform, materialised into one memmap the first
+    time every sample is read and served from it afterwards. `lengths` and `clip_shape` (H, W, C) describe
+    the planned read of every sample; a cache built for another layout is discarded. Workers fill disjoint
+    samples of the shared mapping, a flag per sample marks the finished ones.
+    """
+
+    def __init__(self, path, lengths, clip_shape):
+        self.path = path
+        self.clip_shape = tuple(clip_shape)
+        ends = np.cumsum(lengths, dtype=np.int64)
+        self.spans = np.stack([ends - np.asarray(lengths, dtype=np.int64), ends], axis=1)
+        self.total_frames = int(ends[-1]) if len(ends) > 0 else 0
+        layout = dict(clip_shape=list(self.clip_shape),
+                      lengths=hashlib.md5(np.asarray(lengths, dtype=np.int64).tobytes()).hexdigest())
+        if not self.matches(layout):
+            self.create(layout)
+        self.mem = None
+        self.done = None
+
+    def matches(self, layout):
+        if not all(os.path.exists(p) for p in [self.path, f"{self.path}.done", f"{self.path}.json"]):
+            return False
+        with open(f"{self.path}.json", "r") as f:
+            return json.load(f) == layout
+
+    def create(self, layout):
+        cache_dir = os.path.dirname(self.path)
+        if cache_dir != "" and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        print(f"Create crop cache {self.path}: {self.total_frames} frames, "
+              f"{self.total_frames * int(np.prod(self.clip_shape)) / 1024 ** 3:.1f} GB")
+        np.memmap(self.path, dtype=np.uint8, mode="w+", shape=(max(self.total_frames, 1), *self.clip_shape)).flush()
+        np.memmap(f"{self.path}.done", dtype=np.uint8, mode="w+", shape=(max(len(self.spans), 1),)).flush()
+        # written last, a cache interrupted while being created is created again
+        with open(f"{self.path}.json", "w") as f:
+            json.dump(layout, f)
+
+    def open(self):
+        # opened lazily so that every dataloader worker maps the cache itself
+        self.mem = np.memmap(self.path, dtype=np.uint8, mode="r+", shape=(max(self.total_frames, 1), *self.clip_shape))
+        self.done = np.memmap(f"{self.path}.done", dtype=np.uint8, mode="r+", shape=(max(len(self.spans), 1),))
+
+    def get(self, index):
+        if self.mem is None:
+            self.open()
+        if not self.done[index]:
+            return None
+        start, end = self.spans[index]
+        # a copy, the mapping is writable and must not end up inside a tensor
+        return np.array(self.mem[start:end])
+
+    def put(self, index, clip):
+        if self.mem is None:
+            self.open()
+        start, end = self.spans[index]
+        if clip.shape != (end - start, *self.clip_shape):
+            return
+        # no flush: the mapping is shared, so other workers and later runs read the page cache, and the
+        # kernel writes it back even if the process dies. Only the flag is set per sample, after the clip
+        self.mem[start:end] = clip
+        self.done[index] = 1
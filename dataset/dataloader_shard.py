@@ -0,0 +1,76 @@
+import cv2
+import torch
+import numpy as np
+import torch.utils.data as data
+from concurrent.futures import ThreadPoolExecutor
+from dataset.dataloader_video import BaseFeeder
+from dataset.stores import FrameStore, index_key, resolve_descriptor, stack_clip
+from dataset.shard_store import load_shard_index, iter_shard
+
+
+class ShardFeeder(BaseFeeder, data.IterableDataset):
+    """
+    Streams samples from the tar shards described by the `tar` store of the dataset config
+    (feeder: dataset.dataloader_shard.ShardFeeder, datatype: tar). Every dataloader worker reads
+    its own shards sequentially; in training the shard order is shuffled every epoch and samples
+    are mixed through a small shuffle buffer. Frames are decoded by a thread pool.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(ShardFeeder, self).__init__(*args, **kwargs)
+        stores = kwargs.get('stores')
+        descriptor = resolve_descriptor((self.load_store_config() if stores is None else stores)['tar'], self.mode)
+        self.shards = load_shard_index(descriptor['index'].format(prefix=self.prefix, mode=self.mode))
+        self.frame_shape = tuple(descriptor.get('frame_shape', (256, 256, 3)))
+        self.decode_threads = descriptor.get('threads', 4)
+        self.shuffle_buffer = descriptor.get('shuffle_buffer', 16)
+        self.sample_of_key = {index_key(fileid).decode("utf-8"): i for i, fileid in enumerate(self.inputs_list.fileids())}
+        self.pool = None
+
+    def __iter__(self):
+        worker_info = data.get_worker_info()
+        if worker_info is None:
+            worker_id, num_workers = 0, 1
+            epoch_seed = int(torch.empty((), dtype=torch.int64).random_().item())
+        else:
+            # the base seed is shared by the workers of one epoch and changes every epoch
+            worker_id, num_workers = worker_info.id, worker_info.num_workers
+            epoch_seed = worker_info.seed - worker_info.id
+        shuffle = self.transform_mode == "train"
+        order = np.arange(len(self.shards))
+        if shuffle:
+            np.random.RandomState(epoch_seed % 2 ** 32).shuffle(order)
+        rng = np.random.RandomState((epoch_seed + worker_id) % 2 ** 32)
+        buffer = []
+        for shard_id in order[worker_id::num_workers]:
+            for key, frames in iter_shard(self.shards[shard_id]['path']):
+                if key not in self.sample_of_key:
+                    continue
+                if not shuffle:
+                    yield self.decode_sample(key, frames)
+                    continue
+                buffer.append((key, frames))
+                if len(buffer) >= self.shuffle_buffer:
+                    yield self.decode_sample(*buffer.pop(rng.randint(len(buffer))))
+        while len(buffer) > 0:
+            yield self.decode_sample(*buffer.pop(rng.randint(len(buffer))))
+
+    def decode_frame(self, buf, rows, cols):
+        img = cv2.imdecode(np.frombuffer(buf, dtype=np.uint8), cv2.IMREAD_COLOR)
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)[rows, cols]
+
+    def decode_sample(self, key, frames):
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(self.decode_threads)
+        index = self.sample_of_key[key]
+        fi = self.inputs_list[index]
+        read_args, data_aug = self.data_aug.plan(len(frames), self.frame_shape)
+        rows, cols = FrameStore.window(read_args.get('crop'), read_args.get('flip', False))
+        frame_index = np.arange(len(frames))[read_args.get('frame_index', slice(None))]
+        # decode every sampled frame once, even when the index repeats it
+        unique_index = np.unique(frame_index)
+        decoded = dict(zip(unique_index, self.pool.map(lambda i: self.decode_frame(frames[i], rows, cols),
+                                                       unique_index)))
+        images = stack_clip([decoded[i] for i in frame_index], self.frame_shape, rows, cols)
+        input_data, label = self.normalize(images, self.read_label(fi), data_aug=data_aug)
+        return input_data, label, fi['label_length'], fi['original_info']
@@ -1,11 +1,10 @@
 import os
-import pickle
 import cv2
 import sys
 import pdb
-import six
 import glob
 import time
+import yaml
 import torch
 import random
 import pandas
@@ -15,20 +14,47 @@ sys.path.append ( os.path.dirname ( os.path.abspath ( os.path.dirname ( __file__
 warnings.simplefilter ( action = 'ignore' , category = FutureWarning )
 
 import numpy as np
-# import pyarrow as pa
-from PIL import Image
 import torch.utils.data as data
 from utils import video_augmentation
+from dataset.stores import STORES , build_store
+from dataset.metadata import load_metadata
+from dataset.crop_cache import CropCache
+from dataset.clip_cache import SharedClipCache
+from dataset.read_meter import ReadMeter
+from dataset.feature_store import FeatureStore
+from dataset import compressed_store , lmdb_store , mp4_store  # register the "compressed", "lmdb" and "mp4" datatypes
 from torch.utils.data.sampler import Sampler
 
 sys.path.append ( ".." )
 global kernel_sizes
 
 
+def temporal_padding ( kernel_sizes ) :
+    # frames replicated before every clip and the total temporal stride of the 1d conv stack
+    left_pad = 0
+    last_stride = 1
+    total_stride = 1
+    for layer_idx , ks in enumerate ( kernel_sizes ) :
+        if ks [ 0 ] == 'K' :
+            left_pad = left_pad * last_stride
+            left_pad += int ( (int ( ks [ 1 ] ) - 1) / 2 )
+        elif ks [ 0 ] == 'P' :
+            last_stride = int ( ks [ 1 ] )
+            total_stride = total_stride * last_stride
+    return left_pad , total_stride
+
+
+def padded_length ( max_len , kernel_sizes ) :
+    # length of a batch whose longest clip has max_len frames, as padded by collate_fn
+    left_pad , total_stride = temporal_padding ( kernel_sizes )
+    return int ( np.ceil ( max_len / total_stride ) ) * total_stride + 2 * left_pad
+
+
 class BaseFeeder ( data.Dataset ) :
     def __init__ ( self , prefix , gloss_dict , dataset='phoenix2014' , drop_ratio=1 , num_gloss=-1 , mode="train" ,
                    transform_mode=True ,
-                   datatype="lmdb" , frame_interval=1 , image_scale=1.0 , kernel_size=1 , input_size=224 ) :
+                   datatype="lmdb" , frame_interval=1 , image_scale=1.0 , kernel_size=1 , input_size=224 ,
+                   stores=None , crop_cache=None , clip_cache_gb=0 ) :
         self.mode = mode
         self.ng = num_gloss
         self.prefix = prefix
@@ -38,194 +64,118 @@ class BaseFeeder ( data.Dataset ) :
         self.input_size = input_size
         global kernel_sizes
         kernel_sizes = kernel_size
+        self.kernel_sizes = kernel_size
         self.frame_interval = frame_interval  # not implemented for read_features()
         self.image_scale = image_scale  # not implemented for read_features()
         self.feat_prefix = f"{prefix}/features/fullFrame-256x256px/{mode}"
         self.transform_mode = "train" if transform_mode else "test"
-        self.inputs_list = np.load ( f"./preprocess/{dataset}/{mode}_info.npy" , allow_pickle = True ).item ( )
+        # memory-mapped columns shared by the forked workers, converted from {mode}_info.npy on first use
+        self.inputs_list = load_metadata ( f"./preprocess/{dataset}" , mode , gloss_dict )
+        if datatype in STORES :
+            # where the frames live is declared in the `stores` section of ./configs/{dataset}.yaml
+            self.store = build_store ( datatype , dataset , mode , prefix ,
+                                       self.load_store_config ( ) if stores is None else stores )
+            self.store.bind ( self.inputs_list.fileids ( ) , self.inputs_list.folders ( ) )
+        elif datatype == "features" :
+            # written by seq_feature_generation (--phase features), a link to the work dir
+            self.feature_store = FeatureStore ( f"./features/{mode}" )
+            self.feature_store.bind ( self.inputs_list.fileids ( ) )
         print ( mode , len ( self ) )
+        self.read_meter = ReadMeter ( )
         self.data_aug = self.transform ( )
+        self.crop_cache = None
+        if crop_cache is not None and self.transform_mode == "test" and datatype in STORES :
+            self.crop_cache = self.build_crop_cache ( crop_cache )
+        self.clip_cache = None
+        if clip_cache_gb > 0 and datatype in STORES :
+            # created before the workers fork so that all of them share it
+            self.clip_cache = SharedClipCache ( clip_cache_gb * 1024 ** 3 , len ( self ) , self.store.frame_shape )
         print ( "" )
 
     def __getitem__ ( self , idx ) :
-        if self.data_type == "video" :
-            input_data , label , fi = self.read_video ( idx )
-            input_data , label = self.normalize ( input_data , label )
+        # batch samplers may pass (index, temporal scale shared by the batch)
+        idx , temporal_scale = idx if isinstance ( idx , tuple ) else (idx , None)
+        if self.data_type in STORES :
+            input_data , label , fi , data_aug = self.read_frames ( idx , temporal_scale )
+            input_data , label = self.normalize ( input_data , label , data_aug = data_aug )
             # input_data, label = self.normalize(input_data, label, fi['fileid'])
-            return input_data , torch.LongTensor ( label ) , self.inputs_list [ idx ] [ 'original_info' ]
-        elif self.data_type == "numpy" :
-            input_data , label , fi = self.read_numpy ( idx )
-            input_data , label = self.normalize ( input_data , label )
-            # input_data, label = self.normalize(input_data, label, fi['fileid'])
-            return input_data , torch.LongTensor ( label ) , self.inputs_list [ idx ] [ 'original_info' ]
-        elif self.data_type == "lmdb" :
-            input_data , label , fi = self.read_lmdb ( idx )
-            input_data , label = self.normalize ( input_data , label )
-            return input_data , torch.LongTensor ( label ) , self.inputs_list [ idx ] [ 'original_info' ]
-        elif self.data_type == "numpy" :
-            input_data , label , fi = self.read_numpy ( idx )
-            input_data , label = self.normalize ( input_data , label )
-            return input_data , torch.LongTensor ( label ) , self.inputs_list [ idx ] [ 'original_info' ]
-        elif self.data_type == "memmap" :
-            if hasattr ( self , 'mem' ) == False :
-                self.init_memmap ( )
-            input_data , label , fi = self.read_memmap ( idx )
-            input_data , label = self.normalize ( input_data , label )
-            return input_data , torch.LongTensor ( label ) , self.inputs_list [ idx ] [ 'original_info' ]
+            # label lengths come from the label offsets, collate_fn does not measure every label
+            return input_data , label , fi [ 'label_length' ] , fi [ 'original_info' ]
         else :
             input_data , label = self.read_features ( idx )
-            return input_data , label , self.inputs_list [ idx ] [ 'original_info' ]
-
-    def init_memmap ( self ) :
-        if self.dataset == 'phoenix2014' :
-            with open ( f"./dataset/ph_memmap/phoenix2014-{self.mode}.pickle" , mode = "rb" ) as f :
-                self.info = pickle.load ( f )
-            T = self.info [ -1 ] [ 'end' ]
-            self.info = {i [ "path" ].split ( "/" ) [ -1 ] : [ i [ "start" ] , i [ "end" ] ] for i in self.info}
-            self.mem = np.memmap (
-                f"./dataset/ph_memmap/phoenix2014-bigarray-map-{self.mode}" ,
-                mode = "r" ,
-                shape = (T , 256 , 256 , 3) )
-        elif self.dataset == 'phoenix2014-noback' :
-            with open ( f"./dataset/ph_memmap/phoenix2014-{self.mode}.pickle" , mode = "rb" ) as f :
-                self.info = pickle.load ( f )
-            T = self.info [ -1 ] [ 'end' ]
-            self.info = {i [ "path" ].split ( "/" ) [ -1 ] : [ i [ "start" ] , i [ "end" ] ] for i in self.info}
-            self.mem = np.memmap (
-                f"./dataset/ph_noback_memmap/phoenix2014-noback-{self.mode}" ,
-                mode = "r" ,
-                shape = (T , 256 , 256 , 3) )
-        elif self.dataset == 'ph_fuse' :
-            if self.mode == 'train' :
-                with open ( f"./dataset/ph_fuse_memmap/fuse_ph_train_info.pkl" , mode = "rb" ) as f :
-                    self.info = pickle.load ( f )
-            else:
-                with open ( f"./dataset/ph_memmap/phoenix2014-{self.mode}.pickle" , mode = "rb" ) as f :
-                    self.info = pickle.load ( f )
-            T = self.info [ -1 ] [ 'end' ]
-            self.info = {i [ "path" ].split ( "/" ) [ -1 ] : [ i [ "start" ] , i [ "end" ] ] for i in self.info}
-            if self.mode == 'train' :
-                self.mem = np.memmap (
-                    f"./dataset/ph_fuse_memmap/fuse_ph_memmap" ,
-                    mode = "r" ,
-                    shape = (T , 256 , 256 , 3) )
-            else:
-                self.mem = np.memmap (
-                    f"./dataset/ph_memmap/phoenix2014-bigarray-map-{self.mode}" ,
-                    mode = "r" ,
-                    shape = (T , 256 , 256 , 3) )
-        elif self.dataset == 'phoenix2014-T' :
-            with open (
-                    f"/share/huaiwen_group/guozihang/phoenix2014-T-release_memmap/phoenix2014-T-{self.mode}.pickle" ,
-                    mode = "rb" ) as f :
-                self.info = pickle.load ( f )
-            T = self.info [ -1 ] [ 'end' ]
-            self.info = {i [ "path" ].split ( "/" ) [ -1 ] : [ i [ "start" ] , i [ "end" ] ] for i in self.info}
-            self.mem = np.memmap (
-                f"/share/huaiwen_group/guozihang/phoenix2014-T-release_memmap/phoenix2014-T-bigarray-map-{self.mode}" ,
-                mode = "r" ,
-                shape = (T , 256 , 256 , 3) )
-        elif self.dataset == "CSL-Daily" :
-            with open ( f"/share/huaiwen_group/guozihang/CSL-Daily_memap/csldaily.pickle" , mode = "rb" ) as f :
-                self.info = pickle.load ( f )
-            T = self.info [ -1 ] [ 'end' ]
-            self.info = {i [ "path" ].split ( "/" ) [ -1 ] : [ i [ "start" ] , i [ "end" ] ] for i in self.info}
-            self.mem = np.memmap (
-                f"/share/huaiwen_group/guozihang/CSL-Daily_memap/csldaily" ,
-                mode = "r" ,
-                shape = (T , 256 , 256 , 3) )
+            return input_data , torch.from_numpy ( label.astype ( np.int64 ) ) , \
+                self.feature_store.label_length ( idx ) , self.inputs_list [ idx ] [ 'original_info' ]
 
-    def read_memmap ( self , index ) :
-        fi = self.inputs_list [ index ]
-        label_list = [ ]
-        for phase in fi [ 'label' ].split ( " " ) :
-            if phase == '' :
-                continue
-            if phase in self.dict.keys ( ) :
-                label_list.append ( self.dict [ phase ] [ 0 ] )
-        images = self.mem [ self.info [ fi [ 'fileid' ] + ".npy" ] [ 0 ] :self.info [ fi [ 'fileid' ] + ".npy" ] [ 1 ] ]
-        images = np.split ( images , images.shape [ 0 ] , axis = 0 )
-        images = [ np.squeeze ( im , axis = 0 ) for im in images ]
-        return images , label_list , fi
+    def load_store_config ( self ) :
+        config_path = f"./configs/{self.dataset}.yaml"
+        if not os.path.exists ( config_path ) :
+            return dict ( )
+        with open ( config_path , 'r' ) as f :
+            return yaml.load ( f , Loader = yaml.FullLoader ).get ( 'stores' , dict ( ) )
 
-    def read_numpy ( self , index ) :
-        # load file info
-        fi = self.inputs_list [ index ]
-        if self.dataset in [ "phoenix2014" , "phoenix2014-noback" ] :
-            # img_folder = os.path.join(self.prefix, "features/fullFrame-256x256px/" + fi['folder'])
-            img_folder = os.path.join ( self.prefix , self.mode , fi [ 'fileid' ] + ".npy" )
-        elif self.dataset == 'phoenix2014-T' :
-            img_folder = os.path.join ( self.prefix , self.mode , fi [ 'fileid' ] + ".npy" )
-        elif self.dataset == 'CSL' :
-            img_folder = os.path.join ( self.prefix , "features/fullFrame-256x256px/" + fi [ 'folder' ] + "/*.jpg" )
-        elif self.dataset == 'CSL-Daily' :
-            img_folder = os.path.join ( self.prefix , fi [ 'fileid' ] + ".npy" )
-        label_list = [ ]
-        for phase in fi [ 'label' ].split ( " " ) :
-            if phase == '' :
-                continue
-            if phase in self.dict.keys ( ) :
-                label_list.append ( self.dict [ phase ] [ 0 ] )
-        images = np.load ( img_folder )
-        images = np.split ( images , images.shape [ 0 ] , axis = 0 )
-        images = [ np.squeeze ( im , axis = 0 ) for im in images ]
-        return images , label_list , fi
+    def read_label ( self , fi ) :
+        # a slice of the gloss ids encoded once when the metadata was built
+        return torch.from_numpy ( fi [ 'label_ids' ].astype ( np.int64 ) )
 
-    def read_numpy ( self , index ) :
-        # load file info
-        fi = self.inputs_list [ index ]
-        if self.dataset in [ "phoenix2014-normal" , "phoenix2014-noback" ] :
-            # img_folder = os.path.join(self.prefix, "features/fullFrame-256x256px/" + fi['folder'])
-            img_folder = os.path.join ( self.prefix , self.mode , fi [ 'fileid' ] + ".npy" )
-        elif self.dataset == 'CSL' :
-            img_folder = os.path.join ( self.prefix , "features/fullFrame-256x256px/" + fi [ 'folder' ] + "/*.jpg" )
-        elif self.dataset == 'CSL-Daily' :
-            img_folder = os.path.join ( self.prefix , fi [ 'folder' ] )
-        label_list = [ ]
-        for phase in fi [ 'label' ].split ( " " ) :
-            if phase == '' :
-                continue
-            if phase in self.dict.keys ( ) :
-                label_list.append ( self.dict [ phase ] [ 0 ] )
+    def prefetch ( self , index ) :
+        # called by ReadaheadSampler for samples that will be read soon
+        index = index [ 0 ] if isinstance ( index , tuple ) else index
+        if self.data_type in STORES :
+            self.store.prefetch ( index )
 
-        images = np.load ( img_folder )
-        images = np.split ( images , images.shape [ 0 ] , axis = 0 )
-        images = [ np.squeeze ( im , axis = 0 ) for im in images ]
-        return images , label_list , fi
+    def build_crop_cache ( self , cache_dir ) :
+        # the testing transform plans the same read for a sample every epoch, so its crop can be kept
+        lengths = [ ]
+        clip_shape = None
+        for index in range ( len ( self ) ) :
+            num_frames = self.store.num_frames ( index , self.inputs_list [ index ] )
+            if num_frames is None :
+                print ( f"The {self.data_type} store does not know clip lengths before reading, no crop cache" )
+                return None
+            read_args , _ = self.data_aug.plan ( num_frames , self.store.frame_shape )
+            lengths.append ( len ( np.arange ( num_frames ) [ read_args.get ( 'frame_index' , slice ( None ) ) ] ) )
+            crop = read_args.get ( 'crop' , (0 , 0) + tuple ( self.store.frame_shape [ :2 ] ) )
+            clip_shape = clip_shape or (crop [ 2 ] , crop [ 3 ] , self.store.frame_shape [ 2 ])
+        return CropCache ( f"{cache_dir}/{self.dataset}-{self.mode}-{self.data_type}-"
+                           f"{self.input_size}px-interval{self.frame_interval}" , lengths , clip_shape )
 
-    def read_video ( self , index ) :
+    def read_frames ( self , index , temporal_scale=None ) :
         # load file info
         fi = self.inputs_list [ index ]
-        if 'phoenix' in self.dataset :
-            img_folder = os.path.join ( self.prefix , "features/fullFrame-256x256px/" + fi [ 'folder' ] )
-        elif self.dataset == 'CSL' :
-            img_folder = os.path.join ( self.prefix , "features/fullFrame-256x256px/" + fi [ 'folder' ] + "/*.jpg" )
-        elif self.dataset == 'CSL-Daily' :
-            img_folder = os.path.join ( self.prefix , fi [ 'folder' ] )
-        img_list = sorted ( glob.glob ( img_folder ) )
-        img_list = img_list [ int ( torch.randint ( 0 , self.frame_interval , [ 1 ] ) ) : :self.frame_interval ]
-        label_list = [ ]
-        for phase in fi [ 'label' ].split ( " " ) :
-            if phase == '' :
-                continue
-            if phase in self.dict.keys ( ) :
-                label_list.append ( self.dict [ phase ] [ 0 ] )
-        if self.dataset != 'CSL-Daily' :
-            return [ cv2.cvtColor ( cv2.imread ( img_path ) , cv2.COLOR_BGR2RGB ) for img_path in
-                     img_list ] , label_list , fi
-        else :
-            return [
-                cv2.cvtColor ( cv2.resize ( cv2.imread ( img_path ) [ 40 : , ... ] , (256 , 256) ) , cv2.COLOR_BGR2RGB )
-                for img_path in img_list ] , label_list , fi
+        label_list = self.read_label ( fi )
+        # temporal index, crop and flip are decided before reading so that only the sampled frames
+        # and the crop window are read
+        num_frames = self.store.num_frames ( index , fi )
+        read_args , data_aug = self.data_aug.plan ( num_frames , self.store.frame_shape , temporal_scale )
+        images = self.crop_cache.get ( index ) if self.crop_cache is not None else None
+        if images is None :
+            read_start , bytes_read = time.time ( ) , self.store.bytes_read
+            if self.clip_cache is not None :
+                images = self.read_cached_clip ( index , fi , **read_args )
+            else :
+                images = self.store.read ( index , fi , **read_args )
+            self.read_meter.add ( self.store.bytes_read - bytes_read , time.time ( ) - read_start )
+            if self.crop_cache is not None :
+                self.crop_cache.put ( index , images )
+        return images , label_list , fi , data_aug
+
+    def read_cached_clip ( self , index , fi , crop=None , flip=False , frame_index=slice ( None ) ) :
+        # the whole decoded clip is shared between the workers, the planned read is applied to it
+        clip = self.clip_cache.get ( index )
+        if clip is None :
+            clip = self.store.read ( index , fi )
+            self.clip_cache.put ( index , clip )
+        rows , cols = self.store.window ( crop , flip )
+        return np.ascontiguousarray ( clip [ frame_index , rows , cols ] )
 
     def read_features ( self , index ) :
-        # load file info
-        fi = self.inputs_list [ index ]
-        data = np.load ( f"./features/{self.mode}/{fi [ 'fileid' ]}_features.npy" , allow_pickle = True ).item ( )
-        return data [ 'features' ] , data [ 'label' ]
+        # slices of the mapped float16 array, converted once to float32
+        features , label = self.feature_store.read ( index )
+        return torch.from_numpy ( features.astype ( np.float32 ) ) , label
 
-    def normalize ( self , video , label , file_id=None ) :
-        video , label = self.data_aug ( video , label , file_id )
+    def normalize ( self , video , label , file_id=None , data_aug=None ) :
+        data_aug = self.data_aug if data_aug is None else data_aug
+        video , label = data_aug ( video , label , file_id )
         # video = video.float() / 127.5 - 1
         mean = [ 0.45 , 0.45 , 0.45 ]
         std = [ 0.225 , 0.225 , 0.225 ]
@@ -234,9 +184,13 @@ class BaseFeeder ( data.Dataset ) :
         return video , label
 
     def transform ( self ) :
+        # frame_interval is applied as a strided read, with a random phase in training
+        subsample = [ video_augmentation.TemporalSubsample ( self.frame_interval ,
+                                                              self.transform_mode == "train" ) ] \
+            if self.frame_interval > 1 else [ ]
         if self.transform_mode == "train" :
             print ( "Apply training transform." )
-            return video_augmentation.Compose ( [
+            return video_augmentation.Compose ( subsample + [
                 # video_augmentation.CenterCrop(224),
                 # video_augmentation.WERAugment('/lustre/wangtao/current_exp/exp/baseline/boundary.npy'),
                 video_augmentation.RandomCrop ( self.input_size ) ,
@@ -247,37 +201,19 @@ class BaseFeeder ( data.Dataset ) :
             ] )
         else :
             print ( "Apply testing transform." )
-            return video_augmentation.Compose ( [
+            return video_augmentation.Compose ( subsample + [
                 video_augmentation.CenterCrop ( self.input_size ) ,
                 video_augmentation.Resize ( self.image_scale ) ,
                 video_augmentation.ToTensor ( ) ,
             ] )
 
-    def byte_to_img ( self , byteflow ) :
-        unpacked = pa.deserialize ( byteflow )
-        imgbuf = unpacked [ 0 ]
-        buf = six.BytesIO ( )
-        buf.write ( imgbuf )
-        buf.seek ( 0 )
-        img = Image.open ( buf ).convert ( 'RGB' )
-        return img
-
     @staticmethod
     def collate_fn ( batch ) :
         batch = [ item for item in sorted ( batch , key = lambda x : len ( x [ 0 ] ) , reverse = True ) ]
-        video , label , info = list ( zip ( *batch ) )
+        video , label , label_length , info = list ( zip ( *batch ) )
 
-        left_pad = 0
-        last_stride = 1
-        total_stride = 1
         global kernel_sizes
-        for layer_idx , ks in enumerate ( kernel_sizes ) :
-            if ks [ 0 ] == 'K' :
-                left_pad = left_pad * last_stride
-                left_pad += int ( (int ( ks [ 1 ] ) - 1) / 2 )
-            elif ks [ 0 ] == 'P' :
-                last_stride = int ( ks [ 1 ] )
-                total_stride = total_stride * last_stride
+        left_pad , total_stride = temporal_padding ( kernel_sizes )
         if len ( video [ 0 ].shape ) > 3 :
             max_len = len ( video [ 0 ] )
             video_length = torch.LongTensor (
@@ -304,18 +240,18 @@ class BaseFeeder ( data.Dataset ) :
                 , dim = 0 )
                 for vid in video ]
             padded_video = torch.stack ( padded_video ).permute ( 0 , 2 , 1 )
-        label_length = torch.LongTensor ( [ len ( lab ) for lab in label ] )
+        # frames of every clip before padding, video_length counts the padding fed to the backbone
+        clip_length = torch.LongTensor ( [ len ( vid ) for vid in video ] )
+        # labels arrive as LongTensors, concatenated into one flat target as expected by the CTC loss
+        label_length = torch.LongTensor ( label_length )
         if max ( label_length ) == 0 :
-            return padded_video , video_length , [ ] , [ ] , info
+            return padded_video , video_length , [ ] , [ ] , clip_length , info
         else :
-            padded_label = [ ]
-            for lab in label :
-                padded_label.extend ( lab )
-            padded_label = torch.LongTensor ( padded_label )
-            return padded_video , video_length , padded_label , label_length , info
+            padded_label = torch.cat ( label )
+            return padded_video , video_length , padded_label , label_length , clip_length , info
 
     def __len__ ( self ) :
-        return len ( self.inputs_list ) - 1
+        return len ( self.inputs_list )
 
     def record_time ( self ) :
         self.cur_time = time.time ( )
@@ -328,21 +264,32 @@ class BaseFeeder ( data.Dataset ) :
 
 
 if __name__ == "__main__" :
-    gloss_dict = np.load ( './preprocess/phoenix2014/gloss_dict.npy' , allow_pickle = True ).item ( )
+    # smoke test: python -m dataset.dataloader_video [dataset] [datatype], the synthetic corpus by default
+    dataset = sys.argv [ 1 ] if len ( sys.argv ) > 1 else 'synthetic'
+    datatype = sys.argv [ 2 ] if len ( sys.argv ) > 2 else 'memmap'
+    with open ( f"./configs/{dataset}.yaml" , 'r' ) as f :
+        dataset_info = yaml.load ( f , Loader = yaml.FullLoader )
+    gloss_dict = np.load ( dataset_info [ 'dict_path' ] , allow_pickle = True ).item ( )
     feeder = BaseFeeder (
-        prefix = './dataset/phoenix2014/phoenix-2014-multisigner' ,
+        prefix = dataset_info [ 'dataset_root' ] ,
         gloss_dict = gloss_dict ,
-        dataset = 'phoenix2014' ,
-        datatype = 'video' ,
-        kernel_size = [ 'K5' , 'P2' , 'K5' , 'P2' ]
+        dataset = dataset ,
+        datatype = datatype ,
+        kernel_size = [ 'K5' , 'P2' , 'K5' , 'P2' ] ,
+        stores = dataset_info.get ( 'stores' , dict ( ) ) ,
     )
     dataloader = torch.utils.data.DataLoader (
         dataset = feeder ,
-        batch_size = 1 ,
+        batch_size = 2 ,
         shuffle = True ,
         drop_last = True ,
         num_workers = 0 ,
         collate_fn = feeder.collate_fn ,
     )
-    for data in dataloader :
-        pdb.set_trace ( )
+    start = time.time ( )
+    for batch_idx , data in enumerate ( dataloader ) :
+        print ( f"batch {batch_idx}: video {tuple ( data [ 0 ].shape )} , lengths {data [ 1 ].tolist ( )} , "
+                f"labels {data [ 3 ].tolist ( )} , {time.time ( ) - start:.2f}s" )
+        if batch_idx == 9 :
+            break
+        start = time.time ( )
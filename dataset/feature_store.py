@@ -0,0 +1,107 @@
+import os
+import json
+import mmap
+import numpy as np
+from dataset.stores import load_index, resolve_index, save_index
+
+
+class FeatureWriter(object):
+    """
+    Per-frame features of a split appended to one raw array (`path`/features, float16 by default), with
+    the frame offsets of every sample (`path`/index.npy) and its gloss ids (`path`/labels.npy, offsets in
+    `path`/labels.index.npy). Samples are buffered and written `buffer_frames` frames at a time;
+    `path`/meta.json, written last on close, marks the store as complete.
+    """
+
+    def __init__(self, path, dtype="float16", buffer_frames=8192):
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.buffer_frames = buffer_frames
+        self.file = open(f"{path}/features", "wb")
+        self.buffer, self.buffered = [], 0
+        self.fileids, self.num_frames, self.labels = [], [], []
+        self.feature_dim = None
+
+    def add(self, fileid, features, label):
+        # features (T, C), label the gloss ids of the sample
+        features = np.asarray(features, dtype=self.dtype)
+        if self.feature_dim is None:
+            self.feature_dim = features.shape[1]
+        elif features.shape[1] != self.feature_dim:
+            raise ValueError(f"{fileid} has {features.shape[1]} features per frame, "
+                             f"the store {self.feature_dim}")
+        self.buffer.append(features)
+        self.buffered += len(features)
+        self.fileids.append(fileid)
+        self.num_frames.append(len(features))
+        self.labels.append(np.asarray(label, dtype=np.int32))
+        if self.buffered >= self.buffer_frames:
+            self.flush()
+
+    def flush(self):
+        if self.buffered > 0:
+            np.concatenate(self.buffer).tofile(self.file)
+        self.buffer, self.buffered = [], 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+        ends = np.cumsum(self.num_frames, dtype=np.int64)
+        save_index(f"{self.path}/index.npy", self.fileids, ends - np.array(self.num_frames, dtype=np.int64), ends)
+        label_lengths = np.array([len(label) for label in self.labels], dtype=np.int64)
+        label_ends = np.cumsum(label_lengths)
+        save_index(f"{self.path}/labels.index.npy", self.fileids, label_ends - label_lengths, label_ends)
+        np.save(f"{self.path}/labels.npy", np.concatenate(self.labels + [np.zeros(0, dtype=np.int32)]))
+        with open(f"{self.path}/meta.json", "w") as f:
+            json.dump(dict(num_samples=len(self.fileids), total_frames=int(ends[-1]) if len(ends) > 0 else 0,
+                           feature_dim=self.feature_dim, dtype=self.dtype.name), f)
+
+
+class FeatureStore(object):
+    """
+    Reads the features written by FeatureWriter. The array is mapped lazily in every worker and samples
+    are returned as slices of the mapping, without copies.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.exists(f"{path}/meta.json"):
+            raise FileNotFoundError(f"No feature store in {path}, generate it with --phase features")
+        with open(f"{path}/meta.json", "r") as f:
+            self.meta = json.load(f)
+        self.spans = None
+        self.label_spans = None
+        self.labels = None
+        self.mem = None
+
+    @staticmethod
+    def complete(path, num_samples):
+        if not os.path.exists(f"{path}/meta.json"):
+            return False
+        with open(f"{path}/meta.json", "r") as f:
+            return json.load(f)['num_samples'] == num_samples
+
+    def bind(self, fileids):
+        self.spans = resolve_index(load_index(f"{self.path}/index.npy"), fileids)
+        self.label_spans = resolve_index(load_index(f"{self.path}/labels.index.npy"), fileids)
+        self.labels = np.load(f"{self.path}/labels.npy", mmap_mode="r")
+
+    def label_length(self, index):
+        return int(self.label_spans[index][1] - self.label_spans[index][0])
+
+    def open(self):
+        # opened lazily so that every dataloader worker maps the array itself
+        with open(f"{self.path}/features", "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.mem = np.frombuffer(self.map, dtype=self.meta['dtype'],
+                                 count=self.meta['total_frames'] * self.meta['feature_dim'])
+        self.mem = self.mem.reshape(self.meta['total_frames'], self.meta['feature_dim'])
+
+    def read(self, index):
+        if self.mem is None:
+            self.open()
+        start, end = self.spans[index]
+        label_start, label_end = self.label_spans[index]
+        return self.mem[start:end], self.labels[label_start:label_end]
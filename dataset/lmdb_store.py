@@ -0,0 +1,116 @@
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from dataset.stores import FrameStore, register_store, load_index, resolve_index, save_index, stack_clip
+
+try:
+    import lmdb
+except ImportError:
+    lmdb = None
+
+
+def check_lmdb():
+    if lmdb is None:
+        raise ImportError("The lmdb store needs the `lmdb` package: `pip install lmdb`, "
+                          "or `pip install -r requirements-optional.txt`")
+
+
+def sample_key(key):
+    return int(key).to_bytes(8, "big")
+
+
+def pack_frames(frames):
+    # one value per sample: int64 frame count, int64 size of every encoded frame, then the frames
+    header = np.array([len(frames)] + [len(buf) for buf in frames], dtype=np.int64)
+    return header.tobytes() + b"".join(frames)
+
+
+def unpack_frames(value):
+    value = memoryview(value)
+    num_frames = int(np.frombuffer(value[:8], dtype=np.int64)[0])
+    sizes = np.frombuffer(value[8:8 * (num_frames + 1)], dtype=np.int64)
+    offsets = 8 * (num_frames + 1) + np.concatenate([[0], np.cumsum(sizes)])
+    return [value[offsets[i]:offsets[i + 1]] for i in range(num_frames)]
+
+
+class LmdbWriter(object):
+    """
+    Writes the encoded frames of every sample under an integer key (its position in write order) and,
+    on close, the offset index (`path`.index.npy) whose start is that key and end - start the frame count.
+    """
+
+    def __init__(self, path, map_size=1 << 40, commit_every=64):
+        check_lmdb()
+        self.path = path
+        # the map is sparse on disk, it only bounds the size of the database
+        self.env = lmdb.open(path, map_size=map_size, subdir=True, meminit=False, map_async=True)
+        self.commit_every = commit_every
+        self.txn = self.env.begin(write=True)
+        self.fileids, self.num_frames = [], []
+
+    def add(self, fileid, frames):
+        self.txn.put(sample_key(len(self.fileids)), pack_frames(frames))
+        self.fileids.append(fileid)
+        self.num_frames.append(len(frames))
+        if len(self.fileids) % self.commit_every == 0:
+            self.txn.commit()
+            self.txn = self.env.begin(write=True)
+
+    def close(self):
+        self.txn.commit()
+        self.env.sync()
+        self.env.close()
+        keys = np.arange(len(self.fileids))
+        save_index(f"{self.path}.index.npy", self.fileids, keys, keys + np.array(self.num_frames, dtype=np.int64))
+
+
+@register_store("lmdb")
+class LmdbStore(FrameStore):
+    """
+    Encoded frames of every sample stored as one LMDB value. The environment is opened lazily, read-only
+    and without locks, in every worker; frames are read without copies and decoded by a thread pool.
+    """
+
+    def __init__(self, path, index=None, threads=4, **kwargs):
+        super(LmdbStore, self).__init__(**kwargs)
+        check_lmdb()
+        self.path = self.format(path)
+        self.index_path = self.format(index) if index is not None else f"{self.path}.index.npy"
+        self.threads = threads
+        self.spans = None
+        self.env = None
+        self.pool = None
+
+    def bind(self, fileids, folders):
+        self.spans = resolve_index(load_index(self.index_path), fileids)
+
+    def open(self):
+        # opened lazily so that no environment is inherited across fork
+        self.env = lmdb.open(self.path, subdir=True, readonly=True, lock=False, readahead=False, meminit=False)
+        self.pool = ThreadPoolExecutor(self.threads)
+
+    def num_frames(self, index, fi):
+        return int(self.spans[index][1] - self.spans[index][0])
+
+    @staticmethod
+    def decode_frame(buf, rows, cols):
+        img = cv2.imdecode(np.frombuffer(buf, dtype=np.uint8), cv2.IMREAD_COLOR)
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)[rows, cols]
+
+    def read(self, index, fi, crop=None, flip=False, frame_index=slice(None)):
+        if self.env is None:
+            self.open()
+        rows, cols = self.window(crop, flip)
+        with self.env.begin(buffers=True) as txn:
+            # the value points into the map and is only valid inside the transaction
+            value = txn.get(sample_key(self.spans[index][0]))
+            if value is None:
+                raise KeyError(f"{fi['fileid']} is in the index but not in {self.path}")
+            frames = unpack_frames(value)
+            frame_index = np.arange(len(frames))[frame_index]
+            unique_index = np.unique(frame_index)
+            self.bytes_read += sum(len(frames[i]) for i in unique_index)
+            # decode every sampled frame once, even when the index repeats it
+            decoded = dict(zip(unique_index, self.pool.map(lambda i: self.decode_frame(frames[i], rows, cols),
+                                                           unique_index)))
+        return stack_clip([decoded[i] for i in frame_index], self.frame_shape, rows, cols)
@@ -0,0 +1,111 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+# text columns, stored utf-8 encoded as fixed-width byte strings
+TEXT_COLUMNS = ['fileid', 'folder', 'signer', 'label', 'original_info']
+# bumped whenever the layout of the columns changes, older caches are rebuilt
+META_VERSION = 2
+
+
+def gloss_dict_digest(gloss_dict):
+    # the label ids are only valid for the gloss dict they were built with
+    items = sorted((gloss, int(value[0])) for gloss, value in gloss_dict.items())
+    return hashlib.md5(json.dumps(items, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def load_info(info_path):
+    info = np.load(info_path, allow_pickle=True).item()
+    return [info[k] for k in sorted(k for k in info.keys() if isinstance(k, int))]
+
+
+def label_to_ids(label, gloss_dict):
+    # glosses missing from the dict are dropped, as the feeders always did
+    return [gloss_dict[gloss][0] for gloss in label.split(" ") if gloss != '' and gloss in gloss_dict]
+
+
+def text_column(values):
+    encoded = [str(v).encode("utf-8") for v in values]
+    return np.array(encoded, dtype=f"S{max([len(v) for v in encoded] + [1])}")
+
+
+def build_metadata(info_path, gloss_dict, meta_dir):
+    """
+    Columnar copy of a pickled {mode}_info.npy: one .npy per column in `meta_dir`, with the label of
+    every sample as gloss ids in one flat array (label_ids[label_offsets[i]:label_offsets[i + 1]]).
+    """
+    infos = load_info(info_path)
+    if not os.path.exists(meta_dir):
+        os.makedirs(meta_dir)
+    for name in TEXT_COLUMNS:
+        np.save(f"{meta_dir}/{name}.npy", text_column([info[name] for info in infos]))
+    np.save(f"{meta_dir}/num_frames.npy", np.array([int(info['num_frames']) for info in infos], dtype=np.int64))
+    label_ids = [label_to_ids(info['label'], gloss_dict) for info in infos]
+    np.save(f"{meta_dir}/label_offsets.npy", np.cumsum([0] + [len(ids) for ids in label_ids]).astype(np.int64))
+    np.save(f"{meta_dir}/label_ids.npy", np.array([i for ids in label_ids for i in ids], dtype=np.int32))
+    # written last, marks the columns as complete
+    with open(f"{meta_dir}/meta.json", "w") as f:
+        json.dump(dict(version=META_VERSION, num_samples=len(infos), gloss_dict=gloss_dict_digest(gloss_dict)), f)
+
+
+def load_metadata(info_dir, mode, gloss_dict):
+    """
+    Metadata of one split, converted from {mode}_info.npy on first use and rebuilt when the info file
+    or the gloss dict changes.
+    """
+    info_path = f"{info_dir}/{mode}_info.npy"
+    meta_dir = f"{info_dir}/{mode}_meta"
+    meta_path = f"{meta_dir}/meta.json"
+    stale = not os.path.exists(meta_path) or \
+        (os.path.exists(info_path) and os.path.getmtime(meta_path) < os.path.getmtime(info_path))
+    if not stale:
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        stale = meta.get('version') != META_VERSION or meta['gloss_dict'] != gloss_dict_digest(gloss_dict)
+    if stale:
+        print(f"Convert {info_path} to columnar metadata {meta_dir}")
+        build_metadata(info_path, gloss_dict, meta_dir)
+    return SampleMeta(meta_dir)
+
+
+class SampleMeta(object):
+    """
+    Per-sample metadata as memory-mapped columns, so that forked workers share the pages instead of
+    each touching (and copying) a dict of dicts. Indexing returns a small dict with the keys of the
+    legacy info dicts plus `label_ids`.
+    """
+
+    def __init__(self, meta_dir):
+        self.meta_dir = meta_dir
+        self.columns = {name: np.load(f"{meta_dir}/{name}.npy", mmap_mode="r")
+                        for name in TEXT_COLUMNS + ['num_frames', 'label_ids', 'label_offsets']}
+
+    def __len__(self):
+        return len(self.columns['num_frames'])
+
+    def text(self, name, idx):
+        return self.columns[name][idx].decode("utf-8")
+
+    def label_ids(self, idx):
+        offsets = self.columns['label_offsets']
+        return self.columns['label_ids'][offsets[idx]:offsets[idx + 1]]
+
+    def label_length(self, idx):
+        offsets = self.columns['label_offsets']
+        return int(offsets[idx + 1] - offsets[idx])
+
+    def fileids(self):
+        return [fileid.decode("utf-8") for fileid in self.columns['fileid']]
+
+    def folders(self):
+        return [folder.decode("utf-8") for folder in self.columns['folder']]
+
+    def __getitem__(self, idx):
+        if not 0 <= idx < len(self):
+            raise IndexError(f"sample {idx} out of range for {len(self)} samples")
+        fi = {name: self.text(name, idx) for name in TEXT_COLUMNS}
+        fi['num_frames'] = int(self.columns['num_frames'][idx])
+        fi['label_ids'] = self.label_ids(idx)
+        fi['label_length'] = self.label_length(idx)
+        return fi
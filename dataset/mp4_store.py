@@ -0,0 +1,116 @@
+import os
+import json
+import numpy as np
+from dataset.stores import FrameStore, register_store, index_key, load_index, resolve_index, save_index, \
+    stack_clip
+
+try:
+    import av
+except ImportError:
+    av = None
+
+
+def check_av():
+    if av is None:
+        raise ImportError("The mp4 store needs the `av` package (PyAV): `pip install av`, or `pip install -r requirements-optional.txt`")
+
+
+def mp4_path(root, fileid):
+    return os.path.join(root, f"{index_key(fileid).decode('utf-8')}.mp4")
+
+
+def encode_mp4(frames, path, fps=25, gop=8, crf=18, codec="libx264"):
+    """
+    Encode a (T, H, W, C) RGB clip as a keyframe-dense mp4: a keyframe every `gop` frames and no
+    B-frames, so that reaching any frame decodes at most gop - 1 frames before it. Safe to call from
+    a process pool.
+    """
+    check_av()
+    container = av.open(path, mode="w")
+    stream = container.add_stream(codec, rate=fps)
+    stream.height, stream.width = frames.shape[1:3]
+    stream.pix_fmt = "yuv420p"
+    stream.options = {"crf": str(crf), "g": str(gop), "keyint_min": str(gop), "bf": "0", "sc_threshold": "0"}
+    for frame in frames:
+        for packet in stream.encode(av.VideoFrame.from_ndarray(np.ascontiguousarray(frame), format="rgb24")):
+            container.mux(packet)
+    for packet in stream.encode():
+        container.mux(packet)
+    container.close()
+    return len(frames)
+
+
+def save_mp4_meta(root, fileids, num_frames, frame_shape, fps, gop):
+    # index of per-sample frame counts (`root`.index.npy) and the encoding settings (`root`.json)
+    ends = np.cumsum(num_frames)
+    save_index(f"{root}.index.npy", fileids, ends - np.asarray(num_frames), ends)
+    with open(f"{root}.json", "w") as f:
+        json.dump(dict(frame_shape=list(frame_shape), fps=fps, gop=gop), f)
+
+
+@register_store("mp4")
+class Mp4Store(FrameStore):
+    """
+    One keyframe-dense mp4 per sample in the `path` directory. Only the groups of pictures holding the
+    sampled frames are decoded: the reader seeks to the keyframe before every group it needs and
+    decodes forward to the sampled frames.
+    """
+
+    def __init__(self, path, index=None, threads=2, **kwargs):
+        super(Mp4Store, self).__init__(**kwargs)
+        check_av()
+        self.path = self.format(path)
+        self.index_path = self.format(index) if index is not None else f"{self.path}.index.npy"
+        with open(f"{self.path}.json", "r") as f:
+            self.meta = json.load(f)
+        self.frame_shape = tuple(self.meta['frame_shape'])
+        self.threads = threads
+        self.spans = None
+
+    def bind(self, fileids, folders):
+        self.spans = resolve_index(load_index(self.index_path), fileids)
+
+    def num_frames(self, index, fi):
+        return int(self.spans[index][1] - self.spans[index][0])
+
+    def demux(self, container, stream):
+        # decoded frames in order, counting the bytes of the packets read from the file
+        for packet in container.demux(stream):
+            self.bytes_read += packet.size
+            for frame in packet.decode():
+                yield frame
+
+    def decode(self, path, frames):
+        # frames: sorted unique frame ids; returns {frame id: RGB frame}
+        fps, gop = self.meta['fps'], self.meta['gop']
+        decoded = dict()
+        with av.open(path) as container:
+            stream = container.streams.video[0]
+            stream.thread_type = "AUTO"
+            stream.codec_context.thread_count = self.threads
+            wanted = list(frames)
+            while len(wanted) > 0:
+                keyframe = wanted[0] // gop * gop
+                container.seek(int(round(keyframe / fps / stream.time_base)), stream=stream, backward=True)
+                for frame in self.demux(container, stream):
+                    frame_id = int(round(frame.pts * stream.time_base * fps))
+                    if frame_id < wanted[0]:
+                        continue
+                    if frame_id == wanted[0]:
+                        decoded[wanted.pop(0)] = frame.to_ndarray(format="rgb24")
+                    # seek again when the next sampled frame lies beyond the following keyframe
+                    if len(wanted) == 0 or wanted[0] // gop > frame_id // gop + 1:
+                        break
+                else:
+                    # the clip ended before the remaining frames, repeat the last decoded one
+                    last = decoded[max(decoded)] if len(decoded) > 0 else np.zeros(self.frame_shape, np.uint8)
+                    decoded.update({i: last for i in wanted})
+                    wanted = []
+        return decoded
+
+    def read(self, index, fi, crop=None, flip=False, frame_index=slice(None)):
+        frame_index = np.arange(self.num_frames(index, fi))[frame_index]
+        rows, cols = self.window(crop, flip)
+        # decode every sampled frame once, even when the index repeats it
+        decoded = self.decode(mp4_path(self.path, fi['fileid']), np.unique(frame_index).tolist())
+        return stack_clip([decoded[i][rows, cols] for i in frame_index], self.frame_shape, rows, cols)
@@ -0,0 +1,32 @@
+import time
+import numpy as np
+import multiprocessing as mp
+
+
+class ReadMeter(object):
+    """
+    Samples, bytes and seconds spent reading them from the store, summed over all dataloader workers of a
+    feeder through shared counters created before the workers fork.
+    """
+
+    def __init__(self):
+        self.counters = np.frombuffer(mp.RawArray('d', 3), dtype=np.float64)
+        self.lock = mp.Lock()
+
+    def add(self, nbytes, seconds):
+        with self.lock:
+            self.counters += (1, nbytes, seconds)
+
+    def snapshot(self):
+        return self.counters.copy(), time.time()
+
+    def report(self, since):
+        # throughput between a snapshot and now
+        (samples, nbytes, seconds), wall = self.counters - since[0], time.time() - since[1]
+        return {
+            'samples': int(samples),
+            'MB read': nbytes / 1024 ** 2,
+            'MB/s': nbytes / 1024 ** 2 / max(wall, 1e-6),
+            'samples/s': samples / max(wall, 1e-6),
+            'read ms/sample': seconds * 1000 / max(samples, 1),
+        }
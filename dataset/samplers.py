@@ -0,0 +1,306 @@
+import os
+import threading
+import numpy as np
+import torch.distributed as dist
+from torch.utils.data.sampler import Sampler, BatchSampler
+from dataset.dataloader_video import padded_length
+
+
+def store_order(dataset):
+    # samples in the order their frames are laid out in the store, sample order if it has no offsets
+    spans = getattr(getattr(dataset, 'store', None), 'spans', None)
+    if spans is None:
+        return np.arange(len(dataset))
+    return np.argsort(np.asarray(spans)[:, 0], kind="stable")
+
+
+def clip_lengths(dataset):
+    # frames of every sample, from the store offsets if it has them, the metadata otherwise
+    spans = getattr(getattr(dataset, 'store', None), 'spans', None)
+    if spans is None:
+        return np.asarray(dataset.inputs_list.columns['num_frames'])
+    spans = np.asarray(spans)
+    return spans[:, 1] - spans[:, 0]
+
+
+class BlockShuffleSampler(Sampler):
+    """
+    Shuffles contiguous blocks of `block_size` samples in store order, then shuffles the samples within
+    every window of `window` consecutive shuffled blocks. Reads stay within a few regions of the store,
+    so readahead and the page cache keep working. `window` trades locality for randomness: 1 only
+    shuffles inside each block, len(dataset) / block_size is a full shuffle.
+    """
+
+    def __init__(self, data_source, block_size=32, window=8, seed=None):
+        self.data_source = data_source
+        self.block_size = max(int(block_size), 1)
+        self.window = max(int(window), 1)
+        # drawn from the global generator by default, so that the run seed decides the order
+        self.seed = np.random.randint(2 ** 31) if seed is None else seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __iter__(self):
+        rng = np.random.RandomState((self.seed + self.epoch) % 2 ** 32)
+        self.epoch += 1
+        order = store_order(self.data_source)
+        blocks = [order[i:i + self.block_size] for i in range(0, len(order), self.block_size)]
+        rng.shuffle(blocks)
+        indices = []
+        for i in range(0, len(blocks), self.window):
+            window = np.concatenate(blocks[i:i + self.window])
+            rng.shuffle(window)
+            indices.extend(window.tolist())
+        return iter(indices)
+
+    def __len__(self):
+        return len(self.data_source)
+
+
+class BucketBatchSampler(BatchSampler):
+    """
+    Batches of samples with similar clip lengths, so that little of every batch is padding. Samples are
+    sorted by length (ties broken randomly), cut into buckets of `bucket_batches` batches, shuffled
+    within their bucket and batched; the batches are then shuffled. With `temporal_scaling` (the jitter
+    of TemporalRescale, taken from the feeder transform by default), every batch shares one random scale,
+    passed to the feeder as (index, scale), so the jitter does not spread the lengths of a batch again.
+    """
+
+    def __init__(self, data_source, batch_size, drop_last=False, bucket_batches=8, temporal_scaling=None,
+                 seed=None):
+        self.data_source = data_source
+        self.batch_size = batch_size
+        self.drop_last = drop_last
+        self.bucket_batches = max(int(bucket_batches), 1)
+        self.temporal_scaling = data_source.data_aug.jitter() if temporal_scaling is None else temporal_scaling
+        self.seed = np.random.randint(2 ** 31) if seed is None else seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __iter__(self):
+        rng = np.random.RandomState((self.seed + self.epoch) % 2 ** 32)
+        self.epoch += 1
+        lengths = clip_lengths(self.data_source)
+        order = np.lexsort((rng.random_sample(len(lengths)), lengths))
+        bucket_size = self.batch_size * self.bucket_batches
+        batches = []
+        for i in range(0, len(order), bucket_size):
+            bucket = order[i:i + bucket_size].copy()
+            rng.shuffle(bucket)
+            batches.extend(bucket[j:j + self.batch_size] for j in range(0, len(bucket), self.batch_size))
+        if self.drop_last:
+            batches = [batch for batch in batches if len(batch) == self.batch_size]
+        rng.shuffle(batches)
+        for batch in batches:
+            if self.temporal_scaling > 0:
+                scale = rng.uniform(1.0 - self.temporal_scaling, 1.0 + self.temporal_scaling)
+                yield [(int(index), scale) for index in batch]
+            else:
+                yield batch.tolist()
+
+    def __len__(self):
+        # batches only fall short at the end of a bucket
+        full, rest = divmod(len(self.data_source), self.batch_size * self.bucket_batches)
+        last = rest // self.batch_size if self.drop_last else -(-rest // self.batch_size)
+        return full * self.bucket_batches + last
+
+
+class FrameBudgetBatchSampler(BatchSampler):
+    """
+    Batches packed up to `max_frames` frames fed to the backbone, counting the padding collate_fn adds
+    (every clip padded to the longest one, rounded to the conv stride, plus left/right padding), so that
+    activation memory stays flat whatever the clip lengths. Samples are sorted by length within buckets
+    of `bucket_size` samples and the batches are shuffled, unless `shuffle` is off (evaluation).
+    `batch_size` caps the samples per batch. Lengths are the planned ones after the temporal transforms
+    of the feeder, with one random TemporalRescale scale shared per batch in training.
+    """
+
+    def __init__(self, data_source, batch_size, max_frames, drop_last=False, bucket_size=256, shuffle=True,
+                 temporal_scaling=None, seed=None):
+        self.data_source = data_source
+        self.batch_size = batch_size
+        self.max_frames = max_frames
+        self.drop_last = drop_last
+        self.bucket_size = max(int(bucket_size), 1)
+        self.shuffle = shuffle
+        self.temporal_scaling = data_source.data_aug.jitter() if temporal_scaling is None else temporal_scaling
+        self.seed = np.random.randint(2 ** 31) if seed is None else seed
+        self.epoch = 0
+        self.planned = None
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def batch_frames(self, lengths):
+        return len(lengths) * padded_length(max(lengths), self.data_source.kernel_sizes)
+
+    def plan_epoch(self):
+        # the batches of an epoch are planned once, so that __len__ and __iter__ agree
+        if self.planned is not None and self.planned[0] == self.epoch:
+            return self.planned[1]
+        rng = np.random.RandomState((self.seed + self.epoch) % 2 ** 32)
+        lengths = clip_lengths(self.data_source)
+        if self.shuffle:
+            order = rng.permutation(len(lengths))
+            buckets = [order[i:i + self.bucket_size] for i in range(0, len(order), self.bucket_size)]
+            order = np.concatenate([bucket[np.argsort(lengths[bucket], kind="stable")] for bucket in buckets])
+        else:
+            order = np.argsort(lengths, kind="stable")
+        batches = []
+        batch, batch_lengths, scale = [], [], None
+        for index in order:
+            if len(batch) == 0 and self.temporal_scaling > 0:
+                scale = rng.uniform(1.0 - self.temporal_scaling, 1.0 + self.temporal_scaling)
+            length = self.data_source.data_aug.output_length(int(lengths[index]), scale)
+            full = len(batch) == self.batch_size or \
+                self.batch_frames(batch_lengths + [length]) > self.max_frames
+            if full and len(batch) > 0:
+                batches.append(batch)
+                batch, batch_lengths = [], []
+                if self.temporal_scaling > 0:
+                    scale = rng.uniform(1.0 - self.temporal_scaling, 1.0 + self.temporal_scaling)
+                length = self.data_source.data_aug.output_length(int(lengths[index]), scale)
+            # a clip longer than the budget still gets a batch of its own
+            batch.append((int(index), scale) if scale is not None else int(index))
+            batch_lengths.append(length)
+        # with drop_last, a last batch filled to less than half the budget is dropped
+        if len(batch) > 0 and not (self.drop_last and self.batch_frames(batch_lengths) < self.max_frames / 2):
+            batches.append(batch)
+        if self.shuffle:
+            rng.shuffle(batches)
+        self.planned = (self.epoch, batches)
+        return batches
+
+    def __iter__(self):
+        batches = self.plan_epoch()
+        self.epoch += 1
+        return iter(batches)
+
+    def __len__(self):
+        return len(self.plan_epoch())
+
+
+def distributed_rank(num_replicas=None, rank=None):
+    # from the process group if there is one, from the launcher environment otherwise
+    if dist.is_available() and dist.is_initialized():
+        default_replicas, default_rank = dist.get_world_size(), dist.get_rank()
+    else:
+        default_replicas, default_rank = int(os.environ.get("WORLD_SIZE", 1)), int(os.environ.get("RANK", 0))
+    return (default_replicas if num_replicas is None else num_replicas), (default_rank if rank is None else rank)
+
+
+def sample_shards(dataset, num_shards):
+    # shard of every sample in a sharded store, `num_shards` contiguous runs of the store otherwise
+    shards = getattr(getattr(dataset, 'store', None), 'sample_shard', None)
+    if shards is not None:
+        return np.asarray(shards)
+    shards = np.empty(len(dataset), dtype=np.int64)
+    shards[store_order(dataset)] = np.arange(len(dataset)) * num_shards // max(len(dataset), 1)
+    return shards
+
+
+class NodeLocalSampler(Sampler):
+    """
+    Distributed sampler that mostly gives every node the samples of its own shards (shard k belongs to
+    node k % num_nodes, see stores.node_shards), so that a node can copy only those to local storage.
+    Every epoch is still a global shuffle: a random permutation of the split is partitioned across all
+    replicas, each sample once (padded to equal lengths, or truncated with `drop_last`). Nodes holding
+    more samples than their share hand the rest to the others, which read them from shared storage;
+    `local_fraction` is the part of the last epoch read from the node's own shards.
+    The rank defaults to the process group, or RANK / WORLD_SIZE / LOCAL_WORLD_SIZE of the launcher.
+    main.py trains in a single process with DataParallel and starts neither: without an external
+    distributed launcher there is one replica, and the sampler is a plain shuffle of the whole split.
+    """
+
+    def __init__(self, data_source, num_replicas=None, rank=None, replicas_per_node=None, drop_last=False,
+                 seed=None):
+        self.data_source = data_source
+        self.num_replicas, self.rank = distributed_rank(num_replicas, rank)
+        self.replicas_per_node = int(os.environ.get("LOCAL_WORLD_SIZE", 1)) if replicas_per_node is None \
+            else replicas_per_node
+        if self.num_replicas % self.replicas_per_node != 0:
+            raise ValueError(f"{self.num_replicas} replicas do not fill nodes of {self.replicas_per_node}")
+        self.num_nodes = self.num_replicas // self.replicas_per_node
+        self.node, self.local_rank = divmod(self.rank, self.replicas_per_node)
+        self.drop_last = drop_last
+        if drop_last:
+            self.num_samples = len(data_source) // self.num_replicas
+        else:
+            self.num_samples = -(-len(data_source) // self.num_replicas)
+        # the same on every rank, all of them must draw the same permutation
+        self.seed = 0 if seed is None else seed
+        self.epoch = 0
+        self.local_fraction = None
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __iter__(self):
+        rng = np.random.RandomState((self.seed + self.epoch) % 2 ** 32)
+        self.epoch += 1
+        store = getattr(self.data_source, 'store', None)
+        shards = sample_shards(self.data_source, getattr(store, 'num_shards', self.num_nodes))
+        total_size = self.num_samples * self.num_replicas
+        order = rng.permutation(len(self.data_source))
+        order = np.concatenate([order, order[:total_size - len(order)]])[:total_size]
+        node_share = self.num_samples * self.replicas_per_node
+        nodes = [order[shards[order] % self.num_nodes == node] for node in range(self.num_nodes)]
+        # the samples beyond the share of their node fill the nodes short of theirs
+        spill = np.concatenate([samples[node_share:] for samples in nodes])
+        rng.shuffle(spill)
+        for node in range(self.num_nodes):
+            need = node_share - min(len(nodes[node]), node_share)
+            nodes[node] = np.concatenate([nodes[node][:node_share], spill[:need]])
+            spill = spill[need:]
+            # local and handed-over samples mixed within the node
+            rng.shuffle(nodes[node])
+        indices = nodes[self.node][self.local_rank::self.replicas_per_node]
+        self.local_fraction = float(np.mean(shards[indices] % self.num_nodes == self.node)) if len(indices) else 1.0
+        return iter(indices.tolist())
+
+    def __len__(self):
+        return self.num_samples
+
+
+class ReadaheadSampler(Sampler):
+    """
+    Wraps a sampler (or batch sampler) and, from a background thread, asks the dataset to prefetch the
+    samples it will yield next, `lookahead` items ahead of the dataloader. The hints only warm the
+    page cache, which the dataloader workers share.
+    """
+
+    def __init__(self, sampler, dataset, lookahead=16):
+        self.sampler = sampler
+        self.dataset = dataset
+        self.lookahead = lookahead
+        self.position = 0
+
+    def prefetch_loop(self, order, stop):
+        next_pos = 0
+        while not stop.is_set() and next_pos < len(order):
+            if next_pos >= self.position + self.lookahead:
+                stop.wait(0.005)
+                continue
+            item = order[next_pos]
+            for index in (item if isinstance(item, (list, tuple)) else [item]):
+                self.dataset.prefetch(index)
+            next_pos += 1
+
+    def __iter__(self):
+        order = list(self.sampler)
+        stop = threading.Event()
+        thread = threading.Thread(target=self.prefetch_loop, args=(order, stop), daemon=True)
+        thread.start()
+        try:
+            for pos, item in enumerate(order):
+                self.position = pos
+                yield item
+        finally:
+            stop.set()
+
+    def __len__(self):
+        return len(self.sampler)
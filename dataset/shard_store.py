@@ -0,0 +1,75 @@
+import io
+import os
+import json
+import tarfile
+from dataset.stores import index_key
+
+READ_BUFFER = 16 * 1024 * 1024
+
+
+class ShardWriter(object):
+    """
+    Writes samples as sequential tar shards of encoded frames, `{sample key}/{frame:06d}.jpg`, with
+    `shard_size` samples per shard. The shard index (`prefix`.json) lists the fileids and frame counts
+    of every shard in order.
+    """
+
+    def __init__(self, prefix, shard_size=256):
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.shards = []
+        self.tar = None
+
+    def add(self, fileid, frames, ext="jpg"):
+        # frames: list of encoded images
+        if self.tar is None or len(self.shards[-1]['fileids']) == self.shard_size:
+            self.next_shard()
+        key = index_key(fileid).decode("utf-8")
+        for frame_idx, buf in enumerate(frames):
+            member = tarfile.TarInfo(f"{key}/{frame_idx:06d}.{ext}")
+            member.size = len(buf)
+            self.tar.addfile(member, io.BytesIO(buf))
+        self.shards[-1]['fileids'].append(fileid)
+        self.shards[-1]['num_frames'].append(len(frames))
+
+    def next_shard(self):
+        if self.tar is not None:
+            self.tar.close()
+        path = f"{self.prefix}-{len(self.shards):06d}.tar"
+        self.tar = tarfile.open(path, mode="w")
+        self.shards.append(dict(path=os.path.basename(path), fileids=[], num_frames=[]))
+
+    def close(self):
+        if self.tar is not None:
+            self.tar.close()
+        with open(f"{self.prefix}.json", "w") as f:
+            json.dump(dict(shards=self.shards), f)
+
+
+def load_shard_index(index_path):
+    with open(index_path, "r") as f:
+        shards = json.load(f)['shards']
+    root = os.path.dirname(index_path)
+    for shard in shards:
+        shard['path'] = os.path.join(root, shard['path'])
+    return shards
+
+
+def iter_shard(path):
+    """
+    Yields (sample key, [encoded frames]) in shard order, reading the tar as one sequential stream.
+    """
+    with open(path, "rb", buffering=READ_BUFFER) as f:
+        tar = tarfile.open(fileobj=f, mode="r|")
+        key, frames = None, []
+        for member in tar:
+            if not member.isfile():
+                continue
+            member_key = member.name.rsplit("/", 1)[0]
+            if member_key != key and key is not None:
+                yield key, frames
+                frames = []
+            key = member_key
+            frames.append(tar.extractfile(member).read())
+        if key is not None:
+            yield key, frames
@@ -0,0 +1,409 @@
+import os
+import cv2
+import glob
+import mmap
+import pickle
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+STORES = dict()
+
+
+def register_store(datatype):
+    def wrapper(cls):
+        STORES[datatype] = cls
+        return cls
+    return wrapper
+
+
+def resolve_descriptor(descriptor, mode):
+    # per-split overrides, e.g. ph_fuse trains on its own store but evaluates on the phoenix2014 one
+    descriptor = dict(descriptor)
+    descriptor.update(descriptor.pop('modes', dict()).get(mode, dict()))
+    return descriptor
+
+
+def index_key(fileid):
+    # legacy pickles are keyed by the file name of the packed sample, i.e. the last part of the fileid
+    return fileid.split("/")[-1].encode("utf-8")
+
+
+def make_index(fileids, starts, ends):
+    keys = [index_key(fileid) for fileid in fileids]
+    index = np.zeros(len(keys), dtype=[('fileid', f"S{max(len(k) for k in keys)}"),
+                                       ('start', np.int64), ('end', np.int64)])
+    index['fileid'] = keys
+    index['start'] = starts
+    index['end'] = ends
+    return np.sort(index, order='fileid')
+
+
+def save_index(index_path, fileids, starts, ends):
+    np.save(index_path, make_index(fileids, starts, ends))
+
+
+def load_index(index_path):
+    """
+    Offset index of a packed store: a structured array (fileid, start, end) sorted by fileid,
+    memory-mapped so that forked workers share its pages. Legacy pickled indices are converted
+    once and cached next to them as *.index.npy.
+    """
+    if index_path.endswith(".npy"):
+        return np.load(index_path, mmap_mode="r")
+    cache_path = os.path.splitext(index_path)[0] + ".index.npy"
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(index_path):
+        return np.load(cache_path, mmap_mode="r")
+    with open(index_path, mode="rb") as f:
+        info = pickle.load(f)
+    index = make_index([os.path.splitext(i["path"])[0] for i in info],
+                       [i["start"] for i in info], [i["end"] for i in info])
+    try:
+        np.save(cache_path, index)
+    except OSError:
+        return index
+    return np.load(cache_path, mmap_mode="r")
+
+
+def lookup_index(index, fileids):
+    # position of every fileid in the sorted index and whether it is there at all
+    keys = [index_key(fileid) for fileid in fileids]
+    # keys wider than the index column would be truncated into false matches
+    fits = np.array([len(key) <= index.dtype['fileid'].itemsize for key in keys], dtype=bool)
+    keys = np.array(keys, dtype=index.dtype['fileid'])
+    pos = np.searchsorted(index['fileid'], keys)
+    found = fits & (pos < len(index))
+    found[found] = index['fileid'][pos[found]] == keys[found]
+    return pos, found
+
+
+def resolve_index(index, fileids):
+    pos, found = lookup_index(index, fileids)
+    if not found.all():
+        missing = [fileids[i] for i in np.flatnonzero(~found)[:5]]
+        raise KeyError(f"{(~found).sum()} samples missing from the store index, e.g. {missing}")
+    return np.stack([index['start'][pos], index['end'][pos]], axis=1)
+
+
+def build_store(datatype, dataset, mode, prefix, descriptors=None):
+    if datatype not in STORES:
+        raise ValueError(f"Unknown datatype: {datatype}, registered stores: {sorted(STORES.keys())}")
+    descriptors = dict() if descriptors is None else descriptors
+    if datatype not in descriptors:
+        raise ValueError(f"No '{datatype}' store configured for {dataset}, add it to the `stores` "
+                         f"section of ./configs/{dataset}.yaml")
+    descriptor = resolve_descriptor(descriptors[datatype], mode)
+    return STORES[datatype](dataset=dataset, mode=mode, prefix=prefix, **descriptor)
+
+
+def window_shape(frame_shape, rows, cols):
+    # shape of a frame cut by a window of FrameStore.window, without allocating a frame
+    return np.broadcast_to(np.uint8(0), frame_shape)[rows, cols].shape
+
+
+def stack_clip(frames, frame_shape, rows, cols):
+    # decoded frames as one clip; no sampled frame is an empty (0, h, w, C) clip, like a read of the raw arrays
+    if len(frames) == 0:
+        return np.empty((0, *window_shape(frame_shape, rows, cols)), dtype=np.uint8)
+    return np.stack(frames)
+
+
+class FrameStore(object):
+    """
+    Location of the frames of one split. Path templates may use {prefix} (dataset_root) and {mode};
+    per-sample templates additionally {fileid} and {folder}.
+    """
+
+    def __init__(self, dataset, mode, prefix, frame_shape=(256, 256, 3)):
+        self.dataset = dataset
+        self.mode = mode
+        self.prefix = prefix
+        self.frame_shape = tuple(frame_shape)
+        # bytes fetched from storage by this process, for benchmarks
+        self.bytes_read = 0
+
+    def format(self, template, fi=None, **extra):
+        fields = dict(prefix=self.prefix, mode=self.mode, **extra)
+        if fi is not None:
+            fields.update(fileid=fi['fileid'], folder=fi['folder'])
+        return template.format(**fields)
+
+    def bind(self, fileids, folders):
+        # called once by BaseFeeder.__init__ with the fileid and folder of every sample, in sample order
+        pass
+
+    @staticmethod
+    def window(crop=None, flip=False):
+        # row and column slices of a crop window (top, left, h, w), flipped horizontally if asked
+        rows, cols = slice(None), slice(None)
+        if crop is not None:
+            top, left, h, w = crop
+            rows, cols = slice(top, top + h), slice(left, left + w)
+        if flip:
+            cols = slice(cols.stop - 1 if cols.stop is not None else None,
+                         cols.start - 1 if cols.start else None, -1)
+        return rows, cols
+
+    def rows_bytes(self, clip):
+        # a crop window of a raw frame still pages in whole rows
+        return clip.shape[0] * clip.shape[1] * int(np.prod(self.frame_shape[1:])) * clip.itemsize
+
+    def num_frames(self, index, fi):
+        # clip length known before reading, used to sample the temporal index; None if unknown
+        return None
+
+    def prefetch(self, index):
+        # hint that the sample will be read soon, may be called from another thread
+        pass
+
+    def read(self, index, fi, crop=None, flip=False, frame_index=slice(None)):
+        # frame_index is a slice (strided read) or an array of frame ids within the clip
+        raise NotImplementedError
+
+
+def fadvise_willneed(fd, offset, length):
+    # asks the kernel to start reading the range into the page cache, returns immediately
+    if hasattr(os, "posix_fadvise") and length > 0:
+        os.posix_fadvise(fd, offset, length, os.POSIX_FADV_WILLNEED)
+
+
+@register_store("memmap")
+class MemmapStore(FrameStore):
+    """
+    All frames of a split in one raw array. With `advise`, prefetch() starts reading upcoming clips into
+    the page cache (WILLNEED). The mapping itself gets no madvise: per-clip advice splits it into many
+    small areas, and SEQUENTIAL lets the kernel drop the pages the other epochs and workers reuse.
+    """
+
+    def __init__(self, path, index, dtype="uint8", advise=True, **kwargs):
+        super(MemmapStore, self).__init__(**kwargs)
+        self.path = self.format(path)
+        self.index_path = self.format(index)
+        self.dtype = dtype
+        self.advise = advise
+        self.frame_bytes = int(np.prod(self.frame_shape)) * np.dtype(dtype).itemsize
+        self.spans = None
+        self.mem = None
+        self.prefetch_fd = None
+
+    def bind(self, fileids, folders):
+        # (start, end) of every sample, resolved by integer sample id before the workers fork
+        index = load_index(self.index_path)
+        self.total_frames = int(index['end'].max())
+        self.spans = resolve_index(index, fileids)
+
+    def open(self):
+        # opened lazily so that every dataloader worker maps the array itself
+        with open(self.path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.mem = np.frombuffer(self.map, dtype=self.dtype, count=self.total_frames * int(np.prod(self.frame_shape)))
+        self.mem = self.mem.reshape(self.total_frames, *self.frame_shape)
+
+    def byte_range(self, index):
+        start, end = self.spans[index]
+        return int(start) * self.frame_bytes, int(end - start) * self.frame_bytes
+
+    def prefetch(self, index):
+        if not self.advise:
+            return
+        if self.prefetch_fd is None:
+            # a descriptor of its own, the mapping belongs to the reading process
+            self.prefetch_fd = os.open(self.path, os.O_RDONLY)
+        fadvise_willneed(self.prefetch_fd, *self.byte_range(index))
+
+    def num_frames(self, index, fi):
+        return int(self.spans[index][1] - self.spans[index][0])
+
+    def read(self, index, fi, crop=None, flip=False, frame_index=slice(None)):
+        if self.mem is None:
+            self.open()
+        start, end = self.spans[index]
+        rows, cols = self.window(crop, flip)
+        # only the sampled frames and the crop window are copied out of the mapped pages
+        clip = np.ascontiguousarray(self.mem[start:end][frame_index, rows, cols])
+        self.bytes_read += self.rows_bytes(clip)
+        return clip
+
+
+def node_shards(num_shards, num_nodes, node):
+    # shards read locally by a node, the ones it copies to its own disk
+    return [shard for shard in range(num_shards) if shard % num_nodes == node]
+
+
+@register_store("sharded_memmap")
+class ShardedMemmapStore(FrameStore):
+    """
+    The frames of a split spread over `num_shards` memmap arrays, each with its own offset index
+    (`path`.index.npy), so that every node of a multi-node run only copies the shards it reads most,
+    see node_shards() and samplers.NodeLocalSampler. `path` takes the shard number as {shard}; a shard
+    found under `local_path` (e.g. on a local NVMe drive) is read from there, the others from `path`.
+    `spans` are the offsets the samples would have in the concatenation of the shards.
+    """
+
+    def __init__(self, path, num_shards, local_path=None, dtype="uint8", advise=True, **kwargs):
+        super(ShardedMemmapStore, self).__init__(**kwargs)
+        self.num_shards = num_shards
+        self.shards = []
+        local_shards = []
+        for shard in range(num_shards):
+            shard_path = self.format(path, shard=shard)
+            if local_path is not None and os.path.exists(self.format(local_path, shard=shard)):
+                shard_path = self.format(local_path, shard=shard)
+                local_shards.append(shard)
+            self.shards.append(MemmapStore(path=shard_path, index=f"{shard_path}.index.npy", dtype=dtype,
+                                           advise=advise, dataset=self.dataset, mode=self.mode, prefix=self.prefix,
+                                           frame_shape=self.frame_shape))
+        if local_path is not None:
+            print(f"{len(local_shards)}/{num_shards} {self.mode} shards on local storage: {local_shards}")
+        self.spans = None
+        self.sample_shard = None
+        self.shard_index = None
+
+    def bind(self, fileids, folders):
+        self.sample_shard = np.full(len(fileids), -1, dtype=np.int64)
+        self.shard_index = np.zeros(len(fileids), dtype=np.int64)
+        self.spans = np.zeros((len(fileids), 2), dtype=np.int64)
+        base = 0
+        for shard, store in enumerate(self.shards):
+            index = load_index(store.index_path)
+            _, found = lookup_index(index, fileids)
+            samples = np.flatnonzero(found & (self.sample_shard < 0))
+            store.bind([fileids[i] for i in samples], None)
+            self.sample_shard[samples] = shard
+            self.shard_index[samples] = np.arange(len(samples))
+            self.spans[samples] = store.spans + base
+            base += store.total_frames
+        if (self.sample_shard < 0).any():
+            missing = [fileids[i] for i in np.flatnonzero(self.sample_shard < 0)[:5]]
+            raise KeyError(f"{(self.sample_shard < 0).sum()} samples missing from every shard index, e.g. {missing}")
+
+    def num_frames(self, index, fi):
+        return int(self.spans[index][1] - self.spans[index][0])
+
+    def prefetch(self, index):
+        self.shards[self.sample_shard[index]].prefetch(self.shard_index[index])
+
+    def read(self, index, fi, crop=None, flip=False, frame_index=slice(None)):
+        store = self.shards[self.sample_shard[index]]
+        bytes_read = store.bytes_read
+        clip = store.read(self.shard_index[index], fi, crop, flip, frame_index)
+        self.bytes_read += store.bytes_read - bytes_read
+        return clip
+
+
+@register_store("numpy")
+class NumpyStore(FrameStore):
+    def __init__(self, path, **kwargs):
+        super(NumpyStore, self).__init__(**kwargs)
+        self.path = path
+        self.last = (None, None)
+
+    def load(self, index, fi):
+        # the header read by num_frames() is reused by the following read()
+        if self.last[0] != index:
+            self.last = (index, np.load(self.format(self.path, fi), mmap_mode="r"))
+        return self.last[1]
+
+    def num_frames(self, index, fi):
+        return len(self.load(index, fi))
+
+    def read(self, index, fi, crop=None, flip=False, frame_index=slice(None)):
+        images = self.load(index, fi)
+        self.last = (None, None)
+        rows, cols = self.window(crop, flip)
+        clip = np.ascontiguousarray(images[frame_index, rows, cols])
+        self.bytes_read += self.rows_bytes(clip)
+        return clip
+
+
+def top_crop_rows(top_crop, height):
+    # top crops are counted on 256-row frames, as the CSL-Daily loader cropped them; scaled to the frame read
+    return int(round(top_crop * height / 256))
+
+
+def glob_root(pattern):
+    # longest leading directory of a glob pattern without wildcards
+    parts = pattern.split("/")
+    for i, part in enumerate(parts):
+        if any(c in part for c in "*?["):
+            return "/".join(parts[:i])
+    return os.path.dirname(pattern)
+
+
+@register_store("video")
+class VideoStore(FrameStore):
+    """
+    Individual image files, listed once into a manifest (`manifest`.paths.npy / .offsets.npy / .folders.npy)
+    that stores the frame paths relative to the folder of every sample. Sampled frames are decoded by a
+    thread pool, cv2 releases the GIL while decoding.
+    """
+
+    def __init__(self, path, top_crop=0, manifest=None, threads=4, **kwargs):
+        super(VideoStore, self).__init__(**kwargs)
+        self.path = path
+        self.top_crop = top_crop
+        self.manifest = self.format(manifest) if manifest is not None else \
+            f"./preprocess/{self.dataset}/{self.mode}_frames"
+        self.threads = threads
+        self.pool = None
+
+    def bind(self, fileids, folders):
+        folders = np.array([folder.encode("utf-8") for folder in folders])
+        if os.path.exists(f"{self.manifest}.folders.npy"):
+            listed = np.load(f"{self.manifest}.folders.npy")
+            if len(listed) != len(folders) or (listed != folders).any():
+                print(f"Frame manifest {self.manifest} lists other samples, list the frames again")
+                self.build_manifest(fileids, folders)
+        else:
+            self.build_manifest(fileids, folders)
+        self.paths = np.load(f"{self.manifest}.paths.npy", mmap_mode="r")
+        self.offsets = np.load(f"{self.manifest}.offsets.npy", mmap_mode="r")
+
+    def build_manifest(self, fileids, folders):
+        patterns = [self.format(self.path, dict(fileid=fileid, folder=folder.decode("utf-8")))
+                    for fileid, folder in zip(fileids, folders)]
+
+        def list_frames(pattern):
+            root = glob_root(pattern)
+            return [os.path.relpath(img_path, root).encode("utf-8") for img_path in sorted(glob.glob(pattern))]
+
+        print(f"List the frames of {len(folders)} samples into {self.manifest}")
+        with ThreadPoolExecutor(16) as pool:
+            frame_lists = list(pool.map(list_frames, patterns))
+        empty = sum(len(img_list) == 0 for img_list in frame_lists)
+        if empty > 0:
+            print(f"{empty} samples have no frames under {self.path}")
+        manifest_dir = os.path.dirname(self.manifest)
+        if manifest_dir != "" and not os.path.exists(manifest_dir):
+            os.makedirs(manifest_dir)
+        paths = [img_path for img_list in frame_lists for img_path in img_list]
+        np.save(f"{self.manifest}.paths.npy", np.array(paths, dtype=f"S{max([len(p) for p in paths] + [1])}"))
+        np.save(f"{self.manifest}.offsets.npy", np.cumsum([0] + [len(img_list) for img_list in frame_lists]))
+        # written last, marks the manifest as complete
+        np.save(f"{self.manifest}.folders.npy", folders)
+
+    def read_frame(self, img_path, rows, cols):
+        # runs on the pool threads, so the size is returned and counted by the caller
+        buf = np.fromfile(img_path, dtype=np.uint8)
+        img = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+        if self.top_crop > 0:
+            img = cv2.resize(img[top_crop_rows(self.top_crop, img.shape[0]):, ...],
+                             (self.frame_shape[1], self.frame_shape[0]))
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)[rows, cols], len(buf)
+
+    def num_frames(self, index, fi):
+        return int(self.offsets[index + 1] - self.offsets[index])
+
+    def read(self, index, fi, crop=None, flip=False, frame_index=slice(None)):
+        if self.pool is None:
+            # created lazily so that every dataloader worker has its own threads
+            self.pool = ThreadPoolExecutor(self.threads)
+        root = glob_root(self.format(self.path, fi))
+        rows, cols = self.window(crop, flip)
+        frame_index = np.arange(self.num_frames(index, fi))[frame_index]
+        # decode every sampled frame once, even when the index repeats it
+        unique_index = np.unique(frame_index)
+        img_paths = [os.path.join(root, self.paths[self.offsets[index] + i].decode("utf-8")) for i in unique_index]
+        frames = list(self.pool.map(lambda img_path: self.read_frame(img_path, rows, cols), img_paths))
+        self.bytes_read += sum(size for _, size in frames)
+        decoded = dict(zip(unique_index, (img for img, _ in frames)))
+        return stack_clip([decoded[i] for i in frame_index], self.frame_shape, rows, cols)
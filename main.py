@@ -22,6 +22,7 @@ faulthandler.enable()
 import utils
 from modules.sync_batchnorm import convert_model
 from seq_scripts import seq_train, seq_eval, seq_feature_generation
+from dataset.samplers import ReadaheadSampler
 from torch.cuda.amp import autocast as autocast
 
 class Processor():
@@ -235,30 +236,57 @@ class Processor():
             dataset_list = zip(["train", "dev"], [True, False])
         elif ('phoenix' in self.arg.dataset) or ('ph' in self.arg.dataset):
             dataset_list = zip(["train", "train_eval", "dev", "test"], [True, False, False, False]) 
-        elif self.arg.dataset == 'CSL-Daily':
+        elif self.arg.dataset in ['CSL-Daily', 'synthetic']:
             dataset_list = zip(["train", "train_eval", "dev", "test"], [True, False, False, False])
         for idx, (mode, train_flag) in enumerate(dataset_list):
             arg = self.arg.feeder_args
             arg["prefix"] = self.arg.dataset_info['dataset_root']
             arg["mode"] = mode.split("_")[0]
             arg["transform_mode"] = train_flag
-            self.dataset[mode] = self.feeder(gloss_dict=self.gloss_dict, kernel_size= self.kernel_sizes, dataset=self.arg.dataset, **arg)
+            self.dataset[mode] = self.feeder(gloss_dict=self.gloss_dict, kernel_size= self.kernel_sizes, dataset=self.arg.dataset,
+                                             stores=self.arg.dataset_info.get('stores', dict()), **arg)
             self.data_loader[mode] = self.build_dataloader(self.dataset[mode], mode, train_flag)
         print("Loading data finished.")
     def init_fn(self, worker_id):
         # np.random.seed(int(self.arg.random_seed)+int(self.arg.device)+worker_id)
         np.random.seed(np.random.get_state()[1][0] + worker_id)
     def build_dataloader(self, dataset, mode, train_flag):
-        return torch.utils.data.DataLoader(
-            dataset,
-            batch_size=self.arg.batch_size if mode == "train" else self.arg.test_batch_size,
-            shuffle=train_flag,
-            drop_last=train_flag,
+        batch_size = self.arg.batch_size if mode == "train" else self.arg.test_batch_size
+        iterable = isinstance(dataset, torch.utils.data.IterableDataset)
+        sampler, batch_sampler = None, None
+        sampler_name, sampler_args = (self.arg.sampler, self.arg.sampler_args) if train_flag else \
+            (self.arg.eval_sampler, self.arg.eval_sampler_args)
+        if sampler_name is not None:
+            sampler_class = import_class(sampler_name)
+            if issubclass(sampler_class, torch.utils.data.BatchSampler):
+                batch_sampler = sampler_class(dataset, batch_size=batch_size, drop_last=train_flag, **sampler_args)
+            else:
+                sampler = sampler_class(dataset, **sampler_args)
+        if self.arg.readahead > 0 and not iterable:
+            if batch_sampler is not None:
+                batch_sampler = ReadaheadSampler(batch_sampler, dataset, self.arg.readahead)
+            else:
+                if sampler is None:
+                    sampler = torch.utils.data.RandomSampler(dataset) if train_flag else \
+                        torch.utils.data.SequentialSampler(dataset)
+                sampler = ReadaheadSampler(sampler, dataset, self.arg.readahead)
+        loader_args = dict(
             num_workers=self.arg.num_worker,  # if train_flag else 0
             collate_fn=self.feeder.collate_fn,
             pin_memory=True,
             worker_init_fn=self.init_fn,
         )
+        if batch_sampler is not None:
+            return torch.utils.data.DataLoader(dataset, batch_sampler=batch_sampler, **loader_args)
+        return torch.utils.data.DataLoader(
+            dataset,
+            batch_size=batch_size,
+            # iterable feeders shuffle their shards themselves
+            shuffle=train_flag and sampler is None and not iterable,
+            sampler=sampler,
+            drop_last=train_flag,
+            **loader_args
+        )
 
 
 def import_class(name):
@@ -0,0 +1,355 @@
+import os
+import sys
+import cv2
+import glob
+import time
+import pickle
+import argparse
+import numpy as np
+from tqdm import tqdm
+from functools import partial
+from multiprocessing import Pool
+
+sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+from dataset.stores import save_index, top_crop_rows
+from dataset.compressed_store import CompressedWriter, compress_clip
+from dataset.shard_store import ShardWriter
+from dataset.lmdb_store import LmdbWriter
+from dataset.mp4_store import encode_mp4, mp4_path, save_mp4_meta
+
+# frame folder pattern of every supported dataset, relative to --dataset-root
+FRAME_PATTERNS = {
+    'phoenix2014': "features/fullFrame-256x256px/{folder}",
+    'phoenix2014-T': "features/fullFrame-256x256px/{folder}",
+    'CSL': "features/fullFrame-256x256px/{folder}/*.jpg",
+    'CSL-Daily': "{folder}",
+    'synthetic': "features/fullFrame-256x256px/{folder}",
+}
+# rows removed from the top of each raw frame before resizing (same as read_video), counted on 256-row
+# frames and scaled to the height of the source frames
+TOP_CROP = {
+    'CSL-Daily': 40,
+}
+
+
+def load_info(info_path):
+    info = np.load(info_path, allow_pickle=True).item()
+    return [info[k] for k in sorted(k for k in info.keys() if isinstance(k, int))]
+
+
+def list_frames(info, dataset, dataset_root):
+    pattern = FRAME_PATTERNS[dataset].format(folder=info['folder'])
+    return sorted(glob.glob(os.path.join(dataset_root, pattern)))
+
+
+def read_frame(img_path, frame_shape, top_crop=0):
+    img = cv2.imread(img_path)
+    if img is None:
+        return None
+    img = img[top_crop_rows(top_crop, img.shape[0]):, ...]
+    if img.shape[:2] != tuple(frame_shape[:2]):
+        img = cv2.resize(img, (frame_shape[1], frame_shape[0]), interpolation=cv2.INTER_LANCZOS4)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
+def pack_sample(job, array_path, frame_shape, top_crop):
+    # workers write disjoint ranges of the preallocated array; every sample maps only its own rows, so
+    # that the flush before its done flag syncs those rows and not the whole array
+    sample_idx, img_list, start = job
+    frames = read_clip(img_list, frame_shape, top_crop)
+    if len(frames) > 0:
+        rows = np.memmap(array_path, dtype=np.uint8, mode="r+", offset=start * int(np.prod(frame_shape)),
+                         shape=frames.shape)
+        rows[:] = frames
+        rows.flush()
+        del rows
+    return sample_idx, len(img_list)
+
+
+def read_clip(img_list, frame_shape, top_crop):
+    frames = np.zeros((len(img_list), *frame_shape), dtype=np.uint8)
+    for frame_idx, img_path in enumerate(img_list):
+        img = read_frame(img_path, frame_shape, top_crop)
+        if img is None:
+            print(f'image destroyed: {img_path}, repeat the previous frame')
+            img = frames[frame_idx - 1] if frame_idx > 0 else frames[frame_idx]
+        frames[frame_idx] = img
+    return frames
+
+
+def compress_sample(job, frame_shape, top_crop, codec, level, chunk_frames):
+    sample_idx, img_list = job
+    frames = read_clip(img_list, frame_shape, top_crop)
+    return sample_idx, len(frames), compress_clip(frames, codec, level, chunk_frames)
+
+
+def encode_sample(job, frame_shape, top_crop, quality):
+    sample_idx, img_list = job
+    frames = read_clip(img_list, frame_shape, top_crop)
+    return sample_idx, [cv2.imencode('.jpg', cv2.cvtColor(frame, cv2.COLOR_RGB2BGR),
+                                     [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes() for frame in frames]
+
+
+def encode_video(job, frame_shape, top_crop, fps, gop, crf):
+    sample_idx, img_list, path = job
+    return sample_idx, encode_mp4(read_clip(img_list, frame_shape, top_crop), path, fps, gop, crf)
+
+
+def list_all_frames(infos, dataset, dataset_root, frames_path, processes):
+    if os.path.exists(frames_path):
+        print(f"Reuse frame lists {frames_path}")
+        with open(frames_path, "rb") as f:
+            return pickle.load(f)
+    print(f"List frames of {len(infos)} samples")
+    with Pool(processes) as p:
+        frame_lists = list(tqdm(p.imap(partial(list_frames, dataset=dataset, dataset_root=dataset_root), infos),
+                                total=len(infos)))
+    # the frame lists are only needed by the builder, keep them out of the index read by the dataloader
+    with open(frames_path, "wb") as f:
+        pickle.dump(frame_lists, f)
+    return frame_lists
+
+
+def frame_index(infos, frame_lists):
+    index = []
+    start = 0
+    for info, img_list in zip(infos, frame_lists):
+        if len(img_list) == 0:
+            print(f"no frames found for {info['fileid']}")
+        index.append({
+            'path': f"{info['fileid']}.npy",
+            'start': start,
+            'end': start + len(img_list),
+        })
+        start += len(img_list)
+    return index
+
+
+def build_index(infos, dataset, dataset_root, index_path, frames_path, processes):
+    frame_lists = list_all_frames(infos, dataset, dataset_root, frames_path, processes)
+    if os.path.exists(index_path):
+        print(f"Reuse frame index {index_path}")
+        with open(index_path, "rb") as f:
+            return pickle.load(f), frame_lists
+    index = frame_index(infos, frame_lists)
+    with open(index_path, "wb") as f:
+        pickle.dump(index, f)
+    # compact binary index read by the dataloader, see dataset.stores.load_index
+    save_index(f"{os.path.splitext(index_path)[0]}.index.npy", [info['fileid'] for info in infos],
+               [item['start'] for item in index], [item['end'] for item in index])
+    return index, frame_lists
+
+
+def build_memmap(dataset, dataset_root, info_path, output_dir, mode, frame_shape, processes, top_crop):
+    index_path = f"{output_dir}/{dataset}-{mode}.pickle"
+    array_path = f"{output_dir}/{dataset}-bigarray-map-{mode}"
+    frames_path = f"{output_dir}/{dataset}-{mode}-frames.pickle"
+    done_path = f"{output_dir}/{dataset}-{mode}.done"
+    index, frame_lists = build_index(load_info(info_path), dataset, dataset_root, index_path, frames_path,
+                                     processes)
+    pack_memmap(index, frame_lists, array_path, done_path, mode, frame_shape, processes, top_crop)
+
+
+def shard_bounds(lengths, num_shards):
+    # contiguous runs of samples with about the same number of frames, at least one sample each
+    num_shards = min(num_shards, len(lengths))
+    ends = np.cumsum(lengths)
+    bounds = np.concatenate([[0], np.searchsorted(ends, ends[-1] * np.arange(1, num_shards) / num_shards,
+                                                  side='right'), [len(lengths)]])
+    for k in range(1, num_shards):
+        bounds[k] = min(max(bounds[k], bounds[k - 1] + 1), len(lengths) - (num_shards - k))
+    return bounds
+
+
+def build_memmap_shards(dataset, dataset_root, info_path, output_dir, mode, frame_shape, processes, top_crop,
+                        num_shards):
+    # every shard is a memmap array with its own index, shards are packed (and resumed) one after the other
+    infos = load_info(info_path)
+    frame_lists = list_all_frames(infos, dataset, dataset_root, f"{output_dir}/{dataset}-{mode}-frames.pickle",
+                                  processes)
+    bounds = shard_bounds([len(img_list) for img_list in frame_lists], num_shards)
+    for shard in range(len(bounds) - 1):
+        array_path = f"{output_dir}/{dataset}-bigarray-map-{mode}-{shard:03d}"
+        shard_infos = infos[bounds[shard]:bounds[shard + 1]]
+        shard_lists = frame_lists[bounds[shard]:bounds[shard + 1]]
+        index = frame_index(shard_infos, shard_lists)
+        save_index(f"{array_path}.index.npy", [info['fileid'] for info in shard_infos],
+                   [item['start'] for item in index], [item['end'] for item in index])
+        print(f"{mode}: shard {shard}, samples {bounds[shard]}-{bounds[shard + 1]}")
+        pack_memmap(index, shard_lists, array_path, f"{array_path}.done", mode, frame_shape, processes, top_crop)
+
+
+def pack_memmap(index, frame_lists, array_path, done_path, mode, frame_shape, processes, top_crop):
+    total_frames = index[-1]['end']
+    array_bytes = total_frames * int(np.prod(frame_shape))
+    if not os.path.exists(array_path) or os.path.getsize(array_path) != array_bytes:
+        print(f"Preallocate {array_path}: {total_frames} frames, {array_bytes / 1024 ** 3:.1f} GB")
+        np.memmap(array_path, dtype=np.uint8, mode="w+", shape=(total_frames, *frame_shape)).flush()
+        if os.path.exists(done_path):
+            os.remove(done_path)
+    # one flag per sample, set only after the sample has been flushed, so an interrupted run resumes
+    if not os.path.exists(done_path):
+        np.memmap(done_path, dtype=np.uint8, mode="w+", shape=(len(index),)).flush()
+    done = np.memmap(done_path, dtype=np.uint8, mode="r+", shape=(len(index),))
+
+    jobs = [(idx, frame_lists[idx], item['start']) for idx, item in enumerate(index) if not done[idx]]
+    print(f"{mode}: {len(index) - len(jobs)}/{len(index)} samples already packed")
+    if len(jobs) == 0:
+        return
+    packed_frames = 0
+    start_time = time.time()
+    with Pool(processes) as p:
+        pbar = tqdm(p.imap_unordered(partial(pack_sample, array_path=array_path, frame_shape=frame_shape,
+                                             top_crop=top_crop), jobs), total=len(jobs))
+        for sample_idx, num_frames in pbar:
+            done[sample_idx] = 1
+            packed_frames += num_frames
+            pbar.set_postfix({'frames/s': f"{packed_frames / (time.time() - start_time):.0f}"})
+    done.flush()
+    elapsed = time.time() - start_time
+    print(f"{mode}: packed {packed_frames} frames in {elapsed:.0f}s ({packed_frames / elapsed:.0f} frames/s)")
+
+
+def build_compressed(dataset, dataset_root, info_path, output_dir, mode, frame_shape, processes, top_crop,
+                     codec, level, chunk_frames):
+    # written sequentially in sample order while a process pool reads and compresses; not resumable
+    infos = load_info(info_path)
+    frame_lists = list_all_frames(infos, dataset, dataset_root, f"{output_dir}/{dataset}-{mode}-frames.pickle",
+                                  processes)
+    writer = CompressedWriter(f"{output_dir}/{dataset}-compressed-{mode}", frame_shape, codec, level, chunk_frames)
+    packed_frames = 0
+    start_time = time.time()
+    with Pool(processes) as p:
+        pbar = tqdm(p.imap(partial(compress_sample, frame_shape=frame_shape, top_crop=top_crop, codec=codec,
+                                   level=level, chunk_frames=chunk_frames), enumerate(frame_lists)),
+                    total=len(frame_lists))
+        for sample_idx, num_frames, chunks in pbar:
+            writer.add(infos[sample_idx]['fileid'], num_frames, chunks)
+            packed_frames += num_frames
+            pbar.set_postfix({'frames/s': f"{packed_frames / (time.time() - start_time):.0f}"})
+    writer.close()
+    elapsed = time.time() - start_time
+    raw_bytes = packed_frames * int(np.prod(frame_shape))
+    print(f"{mode}: packed {packed_frames} frames in {elapsed:.0f}s ({packed_frames / elapsed:.0f} frames/s), "
+          f"{os.path.getsize(writer.path) / raw_bytes:.2%} of the raw size")
+
+
+def build_encoded(dataset, dataset_root, info_path, output_dir, mode, frame_shape, processes, top_crop,
+                  writer, quality):
+    # jpeg frames written sequentially in sample order while a process pool reads and encodes; not resumable
+    infos = load_info(info_path)
+    frame_lists = list_all_frames(infos, dataset, dataset_root, f"{output_dir}/{dataset}-{mode}-frames.pickle",
+                                  processes)
+    packed_frames = 0
+    start_time = time.time()
+    with Pool(processes) as p:
+        pbar = tqdm(p.imap(partial(encode_sample, frame_shape=frame_shape, top_crop=top_crop, quality=quality),
+                           enumerate(frame_lists)), total=len(frame_lists))
+        for sample_idx, frames in pbar:
+            writer.add(infos[sample_idx]['fileid'], frames)
+            packed_frames += len(frames)
+            pbar.set_postfix({'frames/s': f"{packed_frames / (time.time() - start_time):.0f}"})
+    writer.close()
+    elapsed = time.time() - start_time
+    print(f"{mode}: packed {packed_frames} frames in {elapsed:.0f}s ({packed_frames / elapsed:.0f} frames/s)")
+
+
+def build_mp4(dataset, dataset_root, info_path, output_dir, mode, frame_shape, processes, top_crop, fps, gop, crf):
+    # one mp4 per sample; samples whose video already exists are skipped, so an interrupted run resumes
+    infos = load_info(info_path)
+    frame_lists = list_all_frames(infos, dataset, dataset_root, f"{output_dir}/{dataset}-{mode}-frames.pickle",
+                                  processes)
+    root = f"{output_dir}/{dataset}-mp4-{mode}"
+    if not os.path.exists(root):
+        os.makedirs(root)
+    jobs = [(idx, img_list, mp4_path(root, info['fileid'])) for idx, (info, img_list) in
+            enumerate(zip(infos, frame_lists)) if not os.path.exists(mp4_path(root, info['fileid']))]
+    print(f"{mode}: {len(infos) - len(jobs)}/{len(infos)} samples already encoded")
+    packed_frames = 0
+    start_time = time.time()
+    with Pool(processes) as p:
+        pbar = tqdm(p.imap_unordered(partial(encode_video, frame_shape=frame_shape, top_crop=top_crop, fps=fps,
+                                             gop=gop, crf=crf), jobs), total=len(jobs))
+        for sample_idx, num_frames in pbar:
+            packed_frames += num_frames
+            pbar.set_postfix({'frames/s': f"{packed_frames / (time.time() - start_time):.0f}"})
+    # frame counts come from the frame lists, which is what every video was encoded from
+    save_mp4_meta(root, [info['fileid'] for info in infos], [len(img_list) for img_list in frame_lists],
+                  frame_shape, fps, gop)
+    elapsed = time.time() - start_time
+    encoded_bytes = sum(os.path.getsize(mp4_path(root, info['fileid'])) for info in infos)
+    print(f"{mode}: encoded {packed_frames} frames in {elapsed:.0f}s, "
+          f"{encoded_bytes / (sum(map(len, frame_lists)) * int(np.prod(frame_shape))):.2%} of the raw size")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Pack fullFrame-256x256px frames into the stores read by the feeders.')
+    parser.add_argument('--dataset', type=str, default='phoenix2014', choices=list(FRAME_PATTERNS.keys()),
+                        help='dataset name, also the prefix of the output files')
+    parser.add_argument('--dataset-root', type=str, default='../dataset/phoenix2014/phoenix-2014-multisigner',
+                        help='path to the dataset')
+    parser.add_argument('--info-dir', type=str, default=None,
+                        help='directory of {mode}_info.npy, defaults to ./{dataset}')
+    parser.add_argument('--output-dir', type=str, default=None,
+                        help='output directory, defaults to ../dataset/{dataset}_memmap')
+    parser.add_argument('--modes', type=str, nargs='+', default=['train', 'dev', 'test'],
+                        help='splits to pack')
+    parser.add_argument('--frame-size', type=int, default=256,
+                        help='height and width of the stored frames')
+    parser.add_argument('--top-crop', type=int, default=None,
+                        help='rows cropped from the top of each frame before resizing, counted on a 256-row '
+                             'frame, defaults to the dataloader setting of the dataset')
+    parser.add_argument('--processes', type=int, default=16,
+                        help='number of packing processes')
+    parser.add_argument('--format', type=str, default='memmap', choices=['memmap', 'compressed', 'tar', 'lmdb', 'mp4'],
+                        help='raw memmap array, lossless chunk-compressed store, tar shards or lmdb of jpeg '
+                             'frames, or one keyframe-dense mp4 per sample')
+    parser.add_argument('--shards', type=int, default=1,
+                        help='memmap arrays the frames are split into, each with its own index, '
+                             'for the sharded_memmap store')
+    parser.add_argument('--codec', type=str, default='zstd', choices=['zstd', 'lz4'],
+                        help='codec of the compressed store')
+    parser.add_argument('--level', type=int, default=3,
+                        help='compression level of the compressed store')
+    parser.add_argument('--chunk-frames', type=int, default=8,
+                        help='frames per compressed chunk, the unit of random access')
+    parser.add_argument('--shard-size', type=int, default=256,
+                        help='samples per tar shard')
+    parser.add_argument('--jpeg-quality', type=int, default=95,
+                        help='jpeg quality of the frames in tar shards and lmdb')
+    parser.add_argument('--fps', type=int, default=25,
+                        help='frame rate of the mp4 videos')
+    parser.add_argument('--gop', type=int, default=8,
+                        help='frames between mp4 keyframes, the most frames decoded to reach any frame')
+    parser.add_argument('--crf', type=int, default=18,
+                        help='x264 constant rate factor of the mp4 videos, lower is closer to the frames')
+
+    args = parser.parse_args()
+    info_dir = args.info_dir or f"./{args.dataset}"
+    output_dir = args.output_dir or f"../dataset/{args.dataset}_memmap"
+    top_crop = TOP_CROP.get(args.dataset, 0) if args.top_crop is None else args.top_crop
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    frame_shape = (args.frame_size, args.frame_size, 3)
+    for md in args.modes:
+        if args.format == 'mp4':
+            build_mp4(args.dataset, args.dataset_root, f"{info_dir}/{md}_info.npy", output_dir, md,
+                      frame_shape, args.processes, top_crop, args.fps, args.gop, args.crf)
+        elif args.format == 'tar':
+            build_encoded(args.dataset, args.dataset_root, f"{info_dir}/{md}_info.npy", output_dir, md,
+                          frame_shape, args.processes, top_crop,
+                          ShardWriter(f"{output_dir}/{args.dataset}-tar-{md}", args.shard_size), args.jpeg_quality)
+        elif args.format == 'lmdb':
+            build_encoded(args.dataset, args.dataset_root, f"{info_dir}/{md}_info.npy", output_dir, md,
+                          frame_shape, args.processes, top_crop,
+                          LmdbWriter(f"{output_dir}/{args.dataset}-lmdb-{md}"), args.jpeg_quality)
+        elif args.format == 'compressed':
+            build_compressed(args.dataset, args.dataset_root, f"{info_dir}/{md}_info.npy", output_dir, md,
+                             frame_shape, args.processes, top_crop, args.codec, args.level, args.chunk_frames)
+        elif args.shards > 1:
+            build_memmap_shards(args.dataset, args.dataset_root, f"{info_dir}/{md}_info.npy", output_dir, md,
+                                frame_shape, args.processes, top_crop, args.shards)
+        else:
+            build_memmap(args.dataset, args.dataset_root, f"{info_dir}/{md}_info.npy", output_dir, md,
+                         frame_shape, args.processes, top_crop)
@@ -1,5 +1,6 @@
 import re
 import os
+import json
 import cv2
 import pdb
 import glob
@@ -10,6 +11,12 @@ from tqdm import tqdm
 from functools import partial
 from multiprocessing import Pool
 
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+from dataset.metadata import build_metadata
+from dataset.stores import top_crop_rows
+from dataset_memmap import build_memmap, build_compressed
+
 
 def csv2dict(dataset_root, anno_path):
     with open(anno_path,'r', encoding='utf-8') as f:
@@ -51,23 +58,24 @@ def sign_dict_update(total_dict, info):
     return total_dict
 
 
-def resize_img(img_path, dsize='210x260px'):
+def resize_img(img_path, dsize='210x260px', top_crop=0):
     dsize = tuple(int(res) for res in re.findall("\d+", dsize))
     img = cv2.imread(img_path)
     if img is None:
         print(f'image destroyed: {img_path}, please manually modify the numframes')
         return None
-    img = cv2.resize(img, dsize, interpolation=cv2.INTER_LANCZOS4)
+    # the rows the dataloader used to crop from every 256-row frame, every epoch, scaled to this frame
+    img = cv2.resize(img[top_crop_rows(top_crop, img.shape[0]):, ...], dsize, interpolation=cv2.INTER_LANCZOS4)
     return img
 
 
-def resize_dataset(video_idx, dsize, info_dict, dataset_root, target_path):
+def resize_dataset(video_idx, dsize, info_dict, dataset_root, target_path, top_crop=0, overwrite=False):
     info = info_dict[video_idx]
     img_list = glob.glob(f"{dataset_root}/{info['folder']}")
-    if len(img_list) == len(glob.glob(f"{target_path}/{info['folder']}")):
+    if not overwrite and len(img_list) == len(glob.glob(f"{target_path}/{info['folder']}")):
         return
     for img_path in img_list:
-        rs_img = resize_img(img_path, dsize=dsize)
+        rs_img = resize_img(img_path, dsize=dsize, top_crop=top_crop)
         if rs_img is None:
             info_dict[video_idx]['num_frames'] = info_dict[video_idx]['num_frames']-1
             continue
@@ -80,6 +88,19 @@ def resize_dataset(video_idx, dsize, info_dict, dataset_root, target_path):
             cv2.imwrite(rs_img_path, rs_img)
 
 
+def stale_output(marker_path, settings):
+    # output written with other settings (or before they were recorded) has to be redone
+    if not os.path.exists(marker_path):
+        return True
+    with open(marker_path, 'r') as f:
+        return json.load(f) != settings
+
+
+def save_marker(marker_path, settings):
+    with open(marker_path, 'w') as f:
+        json.dump(settings, f)
+
+
 def run_mp_cmd(processes, process_func, process_args):
     with Pool(processes) as p:
         outputs = list(tqdm(p.imap(process_func, process_args), total=len(process_args)))
@@ -109,6 +130,16 @@ if __name__ == '__main__':
                         help='resize image')
     parser.add_argument('--multiprocessing', '-m', action='store_true', default=False,
                         help='whether adopts multiprocessing to accelate the preprocess')
+    parser.add_argument('--top-crop', type=int, default=40,
+                        help='rows cropped from the top of each frame before resizing, counted on a 256-row '
+                             'frame and scaled to the height of the --dataset-root frames')
+    parser.add_argument('--store', type=str, default='frames', choices=['frames', 'memmap', 'compressed'],
+                        help='where the cropped and resized frames go: image files under --target-path, '
+                             'or a memmap / compressed store under --store-dir')
+    parser.add_argument('--store-dir', type=str, default='../dataset/CSL-Daily_memmap',
+                        help='output directory of the memmap or compressed store')
+    parser.add_argument('--processes', type=int, default=16,
+                        help='number of processes packing the store')
 
     args = parser.parse_args()
     mode = ["train", "dev", "test"]
@@ -119,17 +150,24 @@ if __name__ == '__main__':
     # generate information dict
     information = csv2dict(args.dataset_root, f"./{args.dataset}/{args.annotation_file}")
     video_index = np.arange(len(information))
-    if args.process_image:
+    # settings of the written frames or store, recorded once they are complete
+    settings = dict(output_res=args.output_res, top_crop=args.top_crop)
+    if args.process_image and args.store == 'frames':
         print(f"Resize image to {args.output_res}")
+        marker_path = f"{args.target_path}/preprocess.json"
+        # frames resized with other settings are redone instead of skipped because their count matches
+        overwrite = stale_output(marker_path, settings)
         if args.multiprocessing:
-            run_mp_cmd(100, partial(resize_dataset, dsize=args.output_res, info_dict=information, dataset_root=args.dataset_root, target_path=args.target_path), video_index)
+            run_mp_cmd(100, partial(resize_dataset, dsize=args.output_res, info_dict=information, dataset_root=args.dataset_root, target_path=args.target_path, top_crop=args.top_crop, overwrite=overwrite), video_index)
         else:
             for idx in tqdm(video_index):
-                run_cmd(partial(resize_dataset, dsize=args.output_res, info_dict=information, dataset_root=args.dataset_root, target_path=args.target_path), idx)
+                run_cmd(partial(resize_dataset, dsize=args.output_res, info_dict=information, dataset_root=args.dataset_root, target_path=args.target_path, top_crop=args.top_crop, overwrite=overwrite), idx)
                 #resize_dataset(idx, dsize=args.output_res, info_dict=information)
+        if not os.path.exists(args.target_path):
+            os.makedirs(args.target_path)
+        save_marker(marker_path, settings)
     else:
         print("Don't resize images")
-    import pdb; pdb.set_trace()
     with open(f"./{args.dataset}/{args.split_file}",'r', encoding='utf-8') as f:
         files_list = f.readlines()  
     train_files = []
@@ -176,3 +214,26 @@ if __name__ == '__main__':
     for idx, (key, value) in enumerate(sign_dict):
         save_dict[key] = [idx + 1, value]
     np.save(f"./{args.dataset}/gloss_dict.npy", save_dict)
+    for md in mode:
+        # columnar, memory-mappable copy of the information dict read by the dataloader
+        build_metadata(f"./{args.dataset}/{md}_info.npy", save_dict, f"./{args.dataset}/{md}_meta")
+    if args.process_image and args.store != 'frames':
+        # the store packs the cropped and resized frames straight from --dataset-root
+        dsize = tuple(int(res) for res in re.findall("\d+", args.output_res))
+        frame_shape = (dsize[1], dsize[0], 3)
+        if not os.path.exists(args.store_dir):
+            os.makedirs(args.store_dir)
+        marker_path = f"{args.store_dir}/{args.dataset}-{args.store}.json"
+        if args.store == 'memmap' and stale_output(marker_path, settings):
+            # the memmap builder resumes from its per-sample flags, which would keep frames of other settings
+            for md in mode:
+                if os.path.exists(f"{args.store_dir}/{args.dataset}-{md}.done"):
+                    os.remove(f"{args.store_dir}/{args.dataset}-{md}.done")
+        for md in mode:
+            if args.store == 'memmap':
+                build_memmap(args.dataset, args.dataset_root, f"./{args.dataset}/{md}_info.npy", args.store_dir, md,
+                             frame_shape, args.processes, args.top_crop)
+            else:
+                build_compressed(args.dataset, args.dataset_root, f"./{args.dataset}/{md}_info.npy", args.store_dir,
+                                 md, frame_shape, args.processes, args.top_crop, 'zstd', 3, 8)
+        save_marker(marker_path, settings)
@@ -10,6 +10,10 @@ from tqdm import tqdm
 from functools import partial
 from multiprocessing import Pool
 
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+from dataset.metadata import build_metadata
+
 
 def csv2dict(anno_path, dataset_type):
     inputs_list = pandas.read_csv(anno_path)
@@ -129,3 +133,6 @@ if __name__ == '__main__':
     for idx, (key, value) in enumerate(sign_dict):
         save_dict[key] = [idx + 1, value]
     np.save(f"./{args.dataset}/gloss_dict.npy", save_dict)
+    for md in mode:
+        # columnar, memory-mappable copy of the information dict read by the dataloader
+        build_metadata(f"./{args.dataset}/{md}_info.npy", save_dict, f"./{args.dataset}/{md}_meta")
@@ -0,0 +1,180 @@
+import os
+import sys
+import cv2
+import glob
+import argparse
+import numpy as np
+from tqdm import tqdm
+from functools import partial
+from multiprocessing import Pool
+
+sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+from dataset.metadata import build_metadata
+from dataset_preprocess import generate_gt_stm, sign_dict_update
+from dataset_memmap import FRAME_PATTERNS, load_info, build_memmap, build_memmap_shards, build_compressed, \
+    build_encoded, build_mp4
+from dataset.shard_store import ShardWriter
+from dataset.lmdb_store import LmdbWriter
+
+# packed by dataset_memmap.py from the generated frames; the frame folders themselves are the "video" store
+FORMATS = ['numpy', 'memmap', 'sharded_memmap', 'compressed', 'tar', 'lmdb', 'mp4']
+
+
+def reference_lengths(info_path):
+    # (frames, glosses) of every sample of the reference split, drawn in pairs to keep their correlation
+    return np.array([[info['num_frames'], len(info['label'].split())] for info in load_info(info_path)])
+
+
+def reference_glosses(dict_path):
+    # relative frequency of every gloss of the reference vocabulary, the most frequent first
+    counts = np.array(sorted((v[1] for v in np.load(dict_path, allow_pickle=True).item().values()), reverse=True),
+                      dtype=np.float64)
+    return counts / counts.sum()
+
+
+def make_info(mode, lengths, gloss_freq, num_samples, num_signers, image_prefix, rng):
+    info_dict = dict()
+    info_dict['prefix'] = image_prefix
+    for idx, (num_frames, num_glosses) in enumerate(lengths[rng.randint(len(lengths), size=num_samples)]):
+        fileid = f"synthetic_{mode}-{idx:06d}"
+        folder = f"{mode}/{fileid}/1/*.png"
+        signer = f"Signer{rng.randint(num_signers) + 1:02d}"
+        label = " ".join(f"G{gloss:04d}" for gloss in
+                         rng.choice(len(gloss_freq), size=max(int(num_glosses), 1), p=gloss_freq))
+        info_dict[idx] = {
+            'fileid': fileid,
+            'folder': folder,
+            'signer': signer,
+            'label': label,
+            'num_frames': int(num_frames),
+            'original_info': f"{fileid}|{folder}|{signer}|{label}",
+        }
+    return info_dict
+
+
+def render_clip(num_frames, frame_shape, seed):
+    # a smooth random scene panned along a random walk, with a moving patch: about as compressible as signing
+    rng = np.random.RandomState(seed)
+    h, w = frame_shape[:2]
+    scene = cv2.resize(rng.randint(0, 256, (8, 8, 3)).astype(np.uint8), (2 * w, 2 * h),
+                       interpolation=cv2.INTER_CUBIC)
+    pan = np.clip(np.cumsum(rng.randint(-3, 4, (num_frames, 2)), axis=0) + [h // 2, w // 2], 0, [h, w])
+    patch = np.clip(np.cumsum(rng.randint(-6, 7, (num_frames, 2)), axis=0) + [h // 2, w // 2], 0,
+                    [h - h // 8, w - w // 8])
+    color = rng.randint(0, 256, 3).astype(np.uint8)
+    frames = np.empty((num_frames, *frame_shape), dtype=np.uint8)
+    for t in range(num_frames):
+        frames[t] = scene[pan[t, 0]:pan[t, 0] + h, pan[t, 1]:pan[t, 1] + w]
+        frames[t, patch[t, 0]:patch[t, 0] + h // 8, patch[t, 1]:patch[t, 1] + w // 8] = color
+    return frames
+
+
+def write_sample(job, frame_shape, image_prefix, numpy_prefix):
+    seed, info = job
+    frames = render_clip(info['num_frames'], frame_shape, seed)
+    frame_dir = os.path.dirname(f"{image_prefix}/{info['folder']}")
+    if not os.path.exists(frame_dir):
+        os.makedirs(frame_dir)
+    # frames of an earlier corpus would be listed with the new ones
+    for img_path in glob.glob(f"{frame_dir}/*.png"):
+        os.remove(img_path)
+    for t, frame in enumerate(frames):
+        cv2.imwrite(f"{frame_dir}/{info['fileid']}_fn{t:06d}-0.png", cv2.cvtColor(frame, cv2.COLOR_RGB2BGR),
+                    [cv2.IMWRITE_PNG_COMPRESSION, 1])
+    if numpy_prefix is not None:
+        np.save(f"{numpy_prefix}/{info['fileid']}.npy", frames)
+    return len(frames)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Generate a synthetic corpus with the length statistics of a real one, to benchmark the '
+                    'loaders and the train / eval loop without the dataset.')
+    parser.add_argument('--dataset', type=str, default='synthetic',
+                        help='save prefix, also the name of ../configs/{dataset}.yaml')
+    parser.add_argument('--reference', type=str, default='phoenix2014',
+                        help='dataset whose ./{reference}/{mode}_info.npy and gloss_dict.npy give the clip lengths, '
+                             'label lengths and gloss frequencies')
+    parser.add_argument('--dataset-root', type=str, default='../dataset/synthetic',
+                        help='where the frames are written')
+    parser.add_argument('--output-dir', type=str, default=None,
+                        help='output directory of the packed stores, defaults to ../dataset/{dataset}_memmap')
+    parser.add_argument('--evaluation-dir', type=str, default='../evaluation/slr_eval',
+                        help='where the ground truth stm files are read by the evaluation')
+    parser.add_argument('--num-samples', type=int, nargs=3, default=[128, 32, 32], metavar=('TRAIN', 'DEV', 'TEST'),
+                        help='samples of the train, dev and test splits')
+    parser.add_argument('--num-signers', type=int, default=9,
+                        help='signers the samples are spread over')
+    parser.add_argument('--frame-size', type=int, default=256,
+                        help='height and width of the frames')
+    parser.add_argument('--formats', type=str, nargs='*', default=['numpy', 'memmap'], choices=FORMATS,
+                        help='stores built besides the frame folders read by the video datatype')
+    parser.add_argument('--shards', type=int, default=4,
+                        help='shards of the sharded_memmap format, num_shards of its store in the config')
+    parser.add_argument('--processes', type=int, default=16,
+                        help='number of writing processes')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the corpus, the same seed gives the same corpus')
+
+    args = parser.parse_args()
+    mode = ["dev", "test", "train"]
+    num_samples = dict(zip(["train", "dev", "test"], args.num_samples))
+    output_dir = args.output_dir or f"../dataset/{args.dataset}_memmap"
+    image_prefix = f"{args.dataset_root}/features/fullFrame-256x256px"
+    frame_shape = (args.frame_size, args.frame_size, 3)
+    FRAME_PATTERNS.setdefault(args.dataset, "features/fullFrame-256x256px/{folder}")
+    for path in [f"./{args.dataset}", output_dir, args.evaluation_dir]:
+        if not os.path.exists(path):
+            os.makedirs(path)
+    gloss_freq = reference_glosses(f"./{args.reference}/gloss_dict.npy")
+    rng = np.random.RandomState(args.seed)
+    sign_dict = dict()
+    for md in mode:
+        information = make_info(md, reference_lengths(f"./{args.reference}/{md}_info.npy"), gloss_freq,
+                                num_samples[md], args.num_signers, image_prefix, rng)
+        np.save(f"./{args.dataset}/{md}_info.npy", information)
+        sign_dict_update(sign_dict, information)
+        generate_gt_stm(information, f"./{args.dataset}/{args.dataset}-groundtruth-{md}.stm")
+        generate_gt_stm(information, f"{args.evaluation_dir}/{args.dataset}-groundtruth-{md}.stm")
+        numpy_prefix = f"{args.dataset_root}/{md}" if 'numpy' in args.formats else None
+        if numpy_prefix is not None and not os.path.exists(numpy_prefix):
+            os.makedirs(numpy_prefix)
+        infos = [information[idx] for idx in range(num_samples[md])]
+        jobs = [(((args.seed * len(mode) + mode.index(md)) * 10 ** 6 + idx) % 2 ** 32, info)
+                for idx, info in enumerate(infos)]
+        print(f"Render {len(jobs)} {md} samples, {sum(info['num_frames'] for info in infos)} frames")
+        with Pool(args.processes) as p:
+            list(tqdm(p.imap(partial(write_sample, frame_shape=frame_shape, image_prefix=image_prefix,
+                                     numpy_prefix=numpy_prefix), jobs), total=len(jobs)))
+        # frame lists, index and progress flags the builders kept for an earlier corpus
+        for path in [f"{output_dir}/{args.dataset}-{md}-frames.pickle", f"{output_dir}/{args.dataset}-{md}.pickle",
+                     f"{output_dir}/{args.dataset}-{md}.done"] + \
+                glob.glob(f"{output_dir}/{args.dataset}-bigarray-map-{md}-*.done"):
+            if os.path.exists(path):
+                os.remove(path)
+    sign_dict = sorted(sign_dict.items(), key=lambda d: d[0])
+    save_dict = {}
+    for idx, (key, value) in enumerate(sign_dict):
+        save_dict[key] = [idx + 1, value]
+    np.save(f"./{args.dataset}/gloss_dict.npy", save_dict)
+    for md in mode:
+        # columnar, memory-mappable copy of the information dict read by the dataloader
+        build_metadata(f"./{args.dataset}/{md}_info.npy", save_dict, f"./{args.dataset}/{md}_meta")
+        info_path = f"./{args.dataset}/{md}_info.npy"
+        if 'memmap' in args.formats:
+            build_memmap(args.dataset, args.dataset_root, info_path, output_dir, md, frame_shape, args.processes, 0)
+        if 'sharded_memmap' in args.formats:
+            build_memmap_shards(args.dataset, args.dataset_root, info_path, output_dir, md, frame_shape,
+                                args.processes, 0, args.shards)
+        if 'compressed' in args.formats:
+            build_compressed(args.dataset, args.dataset_root, info_path, output_dir, md, frame_shape,
+                             args.processes, 0, 'zstd', 3, 8)
+        if 'tar' in args.formats:
+            build_encoded(args.dataset, args.dataset_root, info_path, output_dir, md, frame_shape, args.processes,
+                          0, ShardWriter(f"{output_dir}/{args.dataset}-tar-{md}", 256), 95)
+        if 'lmdb' in args.formats:
+            build_encoded(args.dataset, args.dataset_root, info_path, output_dir, md, frame_shape, args.processes,
+                          0, LmdbWriter(f"{output_dir}/{args.dataset}-lmdb-{md}"), 95)
+        if 'mp4' in args.formats:
+            build_mp4(args.dataset, args.dataset_root, info_path, output_dir, md, frame_shape, args.processes, 0,
+                      25, 8, 18)
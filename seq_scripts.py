@@ -2,6 +2,7 @@ import os
 import pdb
 import sys
 import copy
+import time
 import torch
 import numpy as np
 import torch.nn as nn
@@ -9,22 +10,43 @@ import wandb
 from tqdm import tqdm
 import torch.nn.functional as F
 from evaluation.slr_eval.wer_calculation import evaluate
+from dataset.feature_store import FeatureStore, FeatureWriter
 from torch.cuda.amp import autocast as autocast
 from torch.cuda.amp import GradScaler
 
+def timed_batches(loader, data_wait):
+    # yields the batches of the loader and records how long the training loop waited for each
+    batches = iter(loader)
+    while True:
+        start = time.time()
+        try:
+            data = next(batches)
+        except StopIteration:
+            return
+        data_wait.append(time.time() - start)
+        yield data
+
+
 def seq_train(loader, model, optimizer, device, epoch_idx, recoder):
     model.train()
     loss_value = []
     total_loss_dict = {}
     clr = [group['lr'] for group in optimizer.optimizer.param_groups]
     scaler = GradScaler()
-    tqdm_loader = tqdm(loader, ncols=100)
+    data_wait = []
+    # frames of the clips and frames fed to the backbone, with the padding collate_fn adds
+    padding = np.zeros(2)
+    epoch_start = time.time()
+    tqdm_loader = tqdm(timed_batches(loader, data_wait), total=len(loader), ncols=100)
     nan = 0
+    read_meter = getattr(loader.dataset, 'read_meter', None)
+    read_start = read_meter.snapshot() if read_meter is not None else None
     for batch_idx, data in enumerate(tqdm_loader):
         vid = device.data_to_device(data[0])
         vid_lgt = device.data_to_device(data[1])
         label = device.data_to_device(data[2])
         label_lgt = device.data_to_device(data[3])
+        padding += (data[4].sum().item(), data[0].shape[0] * data[0].shape[1 if data[0].dim() > 3 else 2])
         optimizer.zero_grad()
         with autocast():
             ret_dict = model(vid, vid_lgt, label=label, label_lgt=label_lgt)
@@ -58,11 +80,24 @@ def seq_train(loader, model, optimizer, device, epoch_idx, recoder):
             for item, value in total_loss_dict.items():
                 recoder.print_log(f'\t Mean {item} loss: {value / recoder.log_interval:.5f}')
                 wandb.log({f"Mean {item} loss": value / recoder.log_interval})
+            recent_wait = data_wait[-recoder.log_interval:]
+            recoder.print_log(f'\t I/O wait: {np.mean(recent_wait) * 1000:.1f} ms/batch, '
+                              f'max {np.max(recent_wait) * 1000:.1f} ms')
+            wandb.log({"I/O wait ms/batch": np.mean(recent_wait) * 1000})
         tqdm_loader.set_postfix({'Loss' : loss.item()})
         del ret_dict
         del loss
         del loss_dict
     optimizer.scheduler.step()
+    recoder.print_log(f'\tI/O wait: {np.sum(data_wait):.1f}s of {time.time() - epoch_start:.1f}s, '
+                      f'{np.mean(data_wait) * 1000:.1f} ms/batch, max {np.max(data_wait) * 1000:.1f} ms')
+    recoder.print_log(f'\tPadding ratio: {1 - padding[0] / max(padding[1], 1):.2%} of the frames fed to the backbone')
+    wandb.log({"Padding ratio": 1 - padding[0] / max(padding[1], 1)})
+    if read_meter is not None:
+        recoder.print_log('\tData read: ' + ', '.join(f'{k}: {v:.2f}' for k, v in read_meter.report(read_start).items()))
+    if getattr(loader.dataset, 'clip_cache', None) is not None:
+        recoder.print_log('\tClip cache: ' + ', '.join(f'{k}: {v:.2f}' if isinstance(v, float) else f'{k}: {v}'
+                                                     for k, v in loader.dataset.clip_cache.stats().items()))
     recoder.print_log('\tMean training loss: {:.10f}.'.format(np.mean(loss_value)))
     wandb.log({"Mean training loss": np.mean(loss_value)})
     return 
@@ -139,29 +174,28 @@ def seq_feature_generation(loader, model, device, mode, work_dir, recoder):
         else:
             os.unlink(tgt_path)
     else:
-        if os.path.exists(src_path) and len(loader.dataset) == len(os.listdir(src_path)):
+        if FeatureStore.complete(src_path, len(loader.dataset)):
             os.symlink(src_path, tgt_path)
             return
 
+    # one float16 array for the split, written in large buffered chunks
+    writer = FeatureWriter(src_path)
     for batch_idx, data in tqdm(enumerate(loader)):
         recoder.record_timer("device")
         vid = device.data_to_device(data[0])
         vid_lgt = device.data_to_device(data[1])
         with torch.no_grad():
             ret_dict = model(vid, vid_lgt)
-        if not os.path.exists(src_path):
-            os.makedirs(src_path)
+        # one transfer per batch, (B, T, C) in half precision
+        features = ret_dict['framewise_features'].transpose(1, 2).half().cpu().numpy()
         start = 0
         for sample_idx in range(len(vid)):
             end = start + data[3][sample_idx]
-            filename = f"{src_path}/{data[-1][sample_idx].split('|')[0]}_features.npy"
-            save_file = {
-                "label": data[2][start:end],
-                "features": ret_dict['framewise_features'][sample_idx][:, :vid_lgt[sample_idx]].T.cpu().detach(),
-            }
-            np.save(filename, save_file)
+            writer.add(data[-1][sample_idx].split('|')[0], features[sample_idx][:data[1][sample_idx]],
+                       data[2][start:end].numpy())
             start = end
         assert end == len(data[2])
+    writer.close()
     os.symlink(src_path, tgt_path)
 
 
@@ -107,7 +107,7 @@ class SLRModel ( nn.Module ) :
                                        probs = False )
 
         return {
-            # "framewise_features": framewise,
+            "framewise_features" : None if self.training else framewise ,
             # "visual_features": conv1d_outputs['visual_feat'],
             "feat_len" : lgt ,
             "conv_logits" : conv1d_outputs [ "conv_logits" ] ,
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("cv2")
+pytest.importorskip("av")
+
+from dataset.mp4_store import Mp4Store, encode_mp4, mp4_path, save_mp4_meta
+
+
+def test_read_sampled_frames(tmp_path):
+    # every frame is one flat gray level, so a decoded frame tells which frame it is despite the lossy codec
+    num_frames, gop = 20, 4
+    frames = np.repeat(np.arange(num_frames, dtype=np.uint8)[:, None, None, None] * 10, 32 * 32 * 3)
+    frames = frames.reshape(num_frames, 32, 32, 3)
+    root = str(tmp_path / "clips")
+    tmp_path.joinpath("clips").mkdir()
+    encode_mp4(frames, mp4_path(root, "sample-0"), fps=25, gop=gop)
+    save_mp4_meta(root, ["sample-0"], [num_frames], (32, 32, 3), fps=25, gop=gop)
+
+    store = Mp4Store(root, dataset="synthetic", mode="dev", prefix=str(tmp_path))
+    store.bind(["sample-0"], ["sample-0"])
+    frame_index = np.array([0, 5, 5, 13, 19])
+    clip = store.read(0, {'fileid': "sample-0"}, frame_index=frame_index)
+
+    assert clip.shape == (len(frame_index), 32, 32, 3)
+    assert clip.dtype == np.uint8
+    np.testing.assert_allclose(clip.reshape(len(frame_index), -1).mean(axis=1), frame_index * 10, atol=3)
+    assert store.bytes_read > 0
@@ -0,0 +1,155 @@
+import os
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+from dataset.stores import save_index, MemmapStore, ShardedMemmapStore, NumpyStore, VideoStore
+
+FRAME_SHAPE = (32, 32, 3)
+FILEIDS = ["sample-0", "sample-1"]
+CROP = (2, 4, 16, 20)
+
+
+@pytest.fixture
+def clips():
+    rng = np.random.RandomState(0)
+    return [rng.randint(0, 256, (n, *FRAME_SHAPE)).astype(np.uint8) for n in [6, 5]]
+
+
+def store_kwargs(tmp_path):
+    return dict(dataset="synthetic", mode="dev", prefix=str(tmp_path), frame_shape=FRAME_SHAPE)
+
+
+def encode_png(frame):
+    return cv2.imencode('.png', cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))[1].tobytes()
+
+
+def write_memmap(path, clips):
+    np.concatenate(clips).tofile(path)
+    ends = np.cumsum([len(clip) for clip in clips])
+    save_index(f"{path}.index.npy", FILEIDS[:len(clips)], ends - [len(clip) for clip in clips], ends)
+
+
+def build_memmap(tmp_path, clips):
+    write_memmap(f"{tmp_path}/bigarray", clips)
+    return MemmapStore(f"{tmp_path}/bigarray", f"{tmp_path}/bigarray.index.npy", **store_kwargs(tmp_path))
+
+
+def build_sharded_memmap(tmp_path, clips):
+    # one sample per shard
+    for shard, clip in enumerate(clips):
+        np.asarray(clip).tofile(f"{tmp_path}/bigarray-{shard}")
+        save_index(f"{tmp_path}/bigarray-{shard}.index.npy", [FILEIDS[shard]], [0], [len(clip)])
+    return ShardedMemmapStore(f"{tmp_path}/bigarray-{{shard}}", len(clips), **store_kwargs(tmp_path))
+
+
+def build_numpy(tmp_path, clips):
+    for fileid, clip in zip(FILEIDS, clips):
+        np.save(f"{tmp_path}/{fileid}.npy", clip)
+    return NumpyStore("{prefix}/{fileid}.npy", **store_kwargs(tmp_path))
+
+
+def build_compressed(tmp_path, clips):
+    pytest.importorskip("zstandard")
+    from dataset.compressed_store import CompressedStore, CompressedWriter, compress_clip
+    writer = CompressedWriter(f"{tmp_path}/compressed", FRAME_SHAPE, chunk_frames=4)
+    for fileid, clip in zip(FILEIDS, clips):
+        writer.add(fileid, len(clip), compress_clip(clip, chunk_frames=4))
+    writer.close()
+    return CompressedStore(f"{tmp_path}/compressed", **store_kwargs(tmp_path))
+
+
+def build_lmdb(tmp_path, clips):
+    pytest.importorskip("lmdb")
+    from dataset.lmdb_store import LmdbStore, LmdbWriter
+    writer = LmdbWriter(f"{tmp_path}/lmdb", map_size=1 << 24)
+    for fileid, clip in zip(FILEIDS, clips):
+        writer.add(fileid, [encode_png(frame) for frame in clip])
+    writer.close()
+    return LmdbStore(f"{tmp_path}/lmdb", **store_kwargs(tmp_path))
+
+
+def build_video(tmp_path, clips):
+    for fileid, clip in zip(FILEIDS, clips):
+        os.makedirs(f"{tmp_path}/frames/{fileid}")
+        for t, frame in enumerate(clip):
+            with open(f"{tmp_path}/frames/{fileid}/{t:06d}.png", "wb") as f:
+                f.write(encode_png(frame))
+    return VideoStore("{prefix}/frames/{folder}", manifest=f"{tmp_path}/manifest", **store_kwargs(tmp_path))
+
+
+def build_mp4(tmp_path, clips):
+    pytest.importorskip("av")
+    from dataset.mp4_store import Mp4Store, encode_mp4, mp4_path, save_mp4_meta
+    os.makedirs(f"{tmp_path}/mp4")
+    for fileid, clip in zip(FILEIDS, clips):
+        encode_mp4(clip, mp4_path(f"{tmp_path}/mp4", fileid), gop=4)
+    save_mp4_meta(f"{tmp_path}/mp4", FILEIDS, [len(clip) for clip in clips], FRAME_SHAPE, fps=25, gop=4)
+    return Mp4Store(f"{tmp_path}/mp4", **store_kwargs(tmp_path))
+
+
+BUILDERS = {
+    'memmap': build_memmap,
+    'sharded_memmap': build_sharded_memmap,
+    'numpy': build_numpy,
+    'compressed': build_compressed,
+    'lmdb': build_lmdb,
+    'video': build_video,
+    'mp4': build_mp4,
+}
+# lossy stores only return frames of the right shape
+LOSSLESS = ['memmap', 'sharded_memmap', 'numpy', 'compressed', 'lmdb', 'video']
+
+
+@pytest.fixture(params=sorted(BUILDERS))
+def store(request, tmp_path, clips):
+    store = BUILDERS[request.param](tmp_path, clips)
+    store.bind(FILEIDS, [f"{fileid}/*.png" for fileid in FILEIDS])
+    store.datatype = request.param
+    return store
+
+
+def sample_info(index):
+    return {'fileid': FILEIDS[index], 'folder': f"{FILEIDS[index]}/*.png"}
+
+
+@pytest.mark.parametrize("crop, flip", [(None, False), (CROP, True)])
+def test_empty_frame_index(store, crop, flip):
+    clip = store.read(1, sample_info(1), crop, flip, frame_index=np.array([], dtype=np.int64))
+    expected = FRAME_SHAPE if crop is None else (CROP[2], CROP[3], 3)
+    assert clip.shape == (0, *expected)
+    assert clip.dtype == np.uint8
+
+
+def test_sampled_frames(store, clips):
+    frame_index = np.array([1, 3, 3, 4])
+    clip = store.read(0, sample_info(0), CROP, True, frame_index=frame_index)
+    expected = clips[0][frame_index, CROP[0]:CROP[0] + CROP[2], CROP[1]:CROP[1] + CROP[3]][:, :, ::-1]
+    assert clip.shape == expected.shape
+    assert clip.dtype == np.uint8
+    if store.datatype in LOSSLESS:
+        np.testing.assert_array_equal(clip, expected)
+
+
+def test_shard_feeder_empty_frame_index(tmp_path, clips):
+    # the tar datatype is decoded by ShardFeeder itself, with the augmentation planning the read
+    pytest.importorskip("torch")
+    from dataset.dataloader_shard import ShardFeeder
+
+    class EmptyPlan(object):
+        def plan(self, num_frames, frame_shape):
+            return dict(crop=CROP, flip=True, frame_index=np.array([], dtype=np.int64)), None
+
+    feeder = ShardFeeder.__new__(ShardFeeder)
+    feeder.pool = None
+    feeder.decode_threads = 2
+    feeder.frame_shape = FRAME_SHAPE
+    feeder.sample_of_key = {FILEIDS[0]: 0}
+    feeder.inputs_list = [{'label_length': 0, 'original_info': FILEIDS[0]}]
+    feeder.data_aug = EmptyPlan()
+    feeder.read_label = lambda fi: []
+    feeder.normalize = lambda images, label, data_aug=None: (images, label)
+    images, _, _, _ = feeder.decode_sample(FILEIDS[0], [encode_png(frame) for frame in clips[0]])
+    assert images.shape == (0, CROP[2], CROP[3], 3)
+    assert images.dtype == np.uint8
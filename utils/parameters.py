@@ -86,6 +86,27 @@ def get_parser():
         action=ParseKwargs,
         default=dict(),
         help='the arguments of data loader')
+    parser.add_argument(
+        '--sampler', default=None, help='sampler of the training split, shuffled uniformly if not given')
+    parser.add_argument(
+        '--sampler-args',
+        nargs='*',
+        action=ParseKwargs,
+        default=dict(),
+        help='the arguments of the sampler')
+    parser.add_argument(
+        '--eval-sampler', default=None, help='sampler of the evaluation splits, sequential if not given')
+    parser.add_argument(
+        '--eval-sampler-args',
+        nargs='*',
+        action=ParseKwargs,
+        default=dict(),
+        help='the arguments of the evaluation sampler')
+    parser.add_argument(
+        '--readahead',
+        type=int,
+        default=0,
+        help='samples prefetched into the page cache ahead of the dataloader, 0 disables it')
 
     # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
     # model
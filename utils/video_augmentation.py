@@ -16,6 +16,35 @@ class Compose(object):
     def __init__(self, transforms):
         self.transforms = transforms
 
+    def plan(self, num_frames, frame_shape, temporal_scale=None):
+        """
+        Fuse the leading crop/flip transforms and any temporal sampling into the read of the clip.
+        Temporal sampling commutes with the per-frame transforms, so it is fused wherever it sits.
+        temporal_scale, if given, replaces the random length jitter of the temporal transforms, e.g. to
+        share one scale across a batch. Returns the arguments for the store read and the transforms left.
+        """
+        read_args = dict()
+        rest = []
+        for t in self.transforms:
+            temporal = getattr(t, 'temporal', False)
+            fusable = len(rest) == 0 or temporal
+            hints = dict(temporal_scale=temporal_scale) if temporal else dict()
+            if fusable and hasattr(t, 'plan') and t.plan(read_args, num_frames, frame_shape, **hints):
+                continue
+            rest.append(t)
+        return read_args, Compose(rest)
+
+    def output_length(self, num_frames, temporal_scale=None):
+        # clip length after the temporal transforms, the longest possible one for random transforms
+        for t in self.transforms:
+            if hasattr(t, 'output_length'):
+                num_frames = t.output_length(num_frames, temporal_scale)
+        return num_frames
+
+    def jitter(self):
+        # range of the random length scale of the temporal transforms, 0 if they keep the length
+        return max([t.U - 1.0 for t in self.transforms if isinstance(t, TemporalRescale)] + [0.0])
+
     def __call__(self, image, label, file_info=None):
         for t in self.transforms:
             if file_info is not None and isinstance(t, WERAugment):
@@ -90,6 +119,8 @@ class ToTensor(object):
             video = np.array(video)
             video = torch.from_numpy(video.transpose((0, 3, 1, 2))).float()
         if isinstance(video, np.ndarray):
+            # the only copy of a clip read as a view (memmap slice, crop, flip) happens here
+            video = np.ascontiguousarray(video) if video.flags.writeable else np.array(video)
             video = torch.from_numpy(video.transpose((0, 3, 1, 2)))
         return video
 
@@ -114,6 +145,17 @@ class RandomCrop(object):
                 raise ValueError('If size is a sequence, it must be of len 2.')
         self.size = size
 
+    def plan(self, read_args, num_frames, frame_shape):
+        crop_h, crop_w = self.size
+        im_h, im_w = frame_shape[:2]
+        if 'crop' in read_args or 'flip' in read_args or crop_h > im_h or crop_w > im_w:
+            return False
+        # same draw order as __call__
+        w1 = random.randint(0, im_w - crop_w)
+        h1 = random.randint(0, im_h - crop_h)
+        read_args['crop'] = (h1, w1, crop_h, crop_w)
+        return True
+
     def __call__(self, clip):
         crop_h, crop_w = self.size
         if isinstance(clip[0], np.ndarray):
@@ -125,21 +167,29 @@ class RandomCrop(object):
                             'but got list of {0}'.format(type(clip[0])))
         if crop_w > im_w:
             pad = crop_w - im_w
-            clip = [np.pad(img, ((0, 0), (pad // 2, pad - pad // 2), (0, 0)), 'constant', constant_values=0) for img in
-                    clip]
+            if isinstance(clip, np.ndarray):
+                clip = np.pad(clip, ((0, 0), (0, 0), (pad // 2, pad - pad // 2), (0, 0)), 'constant', constant_values=0)
+            else:
+                clip = [np.pad(img, ((0, 0), (pad // 2, pad - pad // 2), (0, 0)), 'constant', constant_values=0)
+                        for img in clip]
             w1 = 0
         else:
             w1 = random.randint(0, im_w - crop_w)
 
         if crop_h > im_h:
             pad = crop_h - im_h
-            clip = [np.pad(img, ((pad // 2, pad - pad // 2), (0, 0), (0, 0)), 'constant', constant_values=0) for img in
-                    clip]
+            if isinstance(clip, np.ndarray):
+                clip = np.pad(clip, ((0, 0), (pad // 2, pad - pad // 2), (0, 0), (0, 0)), 'constant', constant_values=0)
+            else:
+                clip = [np.pad(img, ((pad // 2, pad - pad // 2), (0, 0), (0, 0)), 'constant', constant_values=0)
+                        for img in clip]
             h1 = 0
         else:
             h1 = random.randint(0, im_h - crop_h)
 
-        if isinstance(clip[0], np.ndarray):
+        if isinstance(clip, np.ndarray):
+            return clip[:, h1:h1 + crop_h, w1:w1 + crop_w, :]
+        elif isinstance(clip[0], np.ndarray):
             return [img[h1:h1 + crop_h, w1:w1 + crop_w, :] for img in clip]
         elif isinstance(clip[0], PIL.Image.Image):
             return [img.crop((w1, h1, w1 + crop_w, h1 + crop_h)) for img in clip]
@@ -152,6 +202,16 @@ class CenterCrop(object):
         else:
             self.size = size
 
+    def plan(self, read_args, num_frames, frame_shape):
+        if 'crop' in read_args or 'flip' in read_args:
+            return False
+        im_h, im_w = frame_shape[:2]
+        new_h, new_w = self.size
+        new_h = im_h if new_h >= im_h else new_h
+        new_w = im_w if new_w >= im_w else new_w
+        read_args['crop'] = (int(round((im_h - new_h) / 2.)), int(round((im_w - new_w) / 2.)), new_h, new_w)
+        return True
+
     def __call__(self, clip):
         try:
             im_h, im_w, im_c = clip[0].shape
@@ -162,6 +222,8 @@ class CenterCrop(object):
         new_w = im_w if new_w >= im_w else new_w
         top = int(round((im_h - new_h) / 2.))
         left = int(round((im_w - new_w) / 2.))
+        if isinstance(clip, np.ndarray):
+            return clip[:, top:top + new_h, left:left + new_w]
         return [img[top:top + new_h, left:left + new_w] for img in clip]
 
 
@@ -169,9 +231,18 @@ class RandomHorizontalFlip(object):
     def __init__(self, prob):
         self.prob = prob
 
+    def plan(self, read_args, num_frames, frame_shape):
+        if 'flip' in read_args:
+            return False
+        read_args['flip'] = random.random() < self.prob
+        return True
+
     def __call__(self, clip):
         # B, H, W, 3
         flag = random.random() < self.prob
+        if isinstance(clip, np.ndarray):
+            # a negatively strided view, ToTensor makes it contiguous
+            return clip[:, :, ::-1] if flag else clip
         if flag:
             clip = np.flip(clip, axis=2)
             clip = np.ascontiguousarray(copy.deepcopy(clip))
@@ -219,27 +290,78 @@ class RandomRotation(object):
         return rotated
 
 
+class TemporalSubsample(object):
+    """
+    Keep every frame_interval-th frame, starting at a random phase if random_phase is set.
+    Planned as a strided slice, so packed stores read only the kept frames.
+    """
+    temporal = True
+
+    def __init__(self, frame_interval=1, random_phase=True):
+        self.frame_interval = frame_interval
+        self.random_phase = random_phase
+
+    def phase(self):
+        return random.randint(0, self.frame_interval - 1) if self.random_phase else 0
+
+    def plan(self, read_args, num_frames, frame_shape, temporal_scale=None):
+        if 'frame_index' in read_args:
+            return False
+        read_args['frame_index'] = slice(self.phase(), None, self.frame_interval)
+        return True
+
+    def __call__(self, clip):
+        return clip[self.phase()::self.frame_interval]
+
+    def output_length(self, vid_len, scale=None):
+        # phase 0 keeps the most frames
+        return -(-vid_len // self.frame_interval)
+
+
 class TemporalRescale(object):
+    temporal = True
+
     def __init__(self, temp_scaling=0.2, frame_interval=1):
         self.min_len = 32
         self.max_len = int(np.ceil(230/frame_interval))
         self.L = 1.0 - temp_scaling
         self.U = 1.0 + temp_scaling
 
+    def plan(self, read_args, num_frames, frame_shape, temporal_scale=None):
+        # only the sampled frames are read, on top of a strided index planned by TemporalSubsample
+        if num_frames is None:
+            return False
+        base = np.arange(num_frames)[read_args.get('frame_index', slice(None))]
+        read_args['frame_index'] = base[self.sample_index(len(base), temporal_scale)]
+        return True
+
     def __call__(self, clip):
-        vid_len = len(clip)
-        new_len = int(vid_len * (self.L + (self.U - self.L) * np.random.random()))
+        return clip[self.sample_index(len(clip))]
+
+    def random_scale(self):
+        return self.L + (self.U - self.L) * np.random.random()
+
+    def output_length(self, vid_len, scale=None):
+        # length of the rescaled clip, the longest possible one if the scale is not known yet
+        return self.rescaled_length(vid_len, self.U if scale is None else scale)
+
+    def sample_index(self, vid_len, scale=None):
+        new_len = self.rescaled_length(vid_len, self.random_scale() if scale is None else scale)
+        if new_len <= vid_len:
+            index = sorted(random.sample(range(vid_len), new_len))
+        else:
+            index = sorted(random.choices(range(vid_len), k=new_len))
+        return index
+
+    def rescaled_length(self, vid_len, scale):
+        new_len = int(vid_len * scale)
         if new_len < self.min_len:
             new_len = self.min_len
         if new_len > self.max_len:
             new_len = self.max_len
         if (new_len - 4) % 4 != 0:
             new_len += 4 - (new_len - 4) % 4
-        if new_len <= vid_len:
-            index = sorted(random.sample(range(vid_len), new_len))
-        else:
-            index = sorted(random.choices(range(vid_len), k=new_len))
-        return clip[index]
+        return new_len
 
 
 class RandomResize(object):
@@ -315,7 +437,9 @@ class Resize(object):
         new_w = int(im_w * scaling_factor) if scaling_factor>0 and scaling_factor<=1 else int(scaling_factor)
         new_h = int(im_h * scaling_factor) if scaling_factor>0 and scaling_factor<=1 else int(scaling_factor)
         new_size = (new_w, new_h)
-        if isinstance(clip[0], np.ndarray):
+        if isinstance(clip, np.ndarray):
+            return np.stack([np.array(PIL.Image.fromarray(img).resize(new_size)) for img in clip])
+        elif isinstance(clip[0], np.ndarray):
             return [np.array(PIL.Image.fromarray(img).resize(new_size)) for img in clip]
         elif isinstance(clip[0], PIL.Image.Image):
             return [img.resize(size=(new_w, new_h), resample=self._get_PIL_interp(self.interpolation)) for img in clip]